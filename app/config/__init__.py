@@ -1,20 +1,83 @@
+from typing import Dict, List, Literal, Optional
+
 from pydantic import BaseSettings
 
+ReadPreferenceMode = Literal[
+    "primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest"
+]
+
 
 class CommonSettings(BaseSettings):
     SENTRY_DSN: str
     APP_NAME: str = "Ronnia"
     DEBUG_MODE: bool = False
     LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_SAMPLE_RATES: Dict[str, float] = {}
+    LOG_DOCUMENTS: bool = False
+    LOG_QUEUE_SIZE: int = 10000
+    METRICS_TOKEN: Optional[str] = None
+    BOT_API_TOKEN: Optional[str] = None
+    SENTRY_TRACES_SAMPLE_RATE: float = 0.05
+    SENTRY_ROUTE_TRACES_SAMPLE_RATES: Dict[str, float] = {}
+    # Off by default: slow and failed requests are then only kept as
+    # transactions when the head sample traced them. Unhandled exceptions are
+    # still reported as error events either way.
+    SENTRY_TAIL_SAMPLE_RATE: float = 0.0
+    SENTRY_SLOW_TRANSACTION_SECONDS: float = 1.0
+    SENTRY_MAX_TRANSACTIONS_PER_SECOND: float = 10
+    SENTRY_PROFILES_SAMPLE_RATE: float = 0.0
 
 
 class ServerSettings(BaseSettings):
     PUBLISH_HOST: str = "0.0.0.0"
     PUBLISH_PORT: int = 8000
+    # Read by uvicorn as the default of --workers.
+    WEB_CONCURRENCY: int = 1
+    COMPRESSION_MINIMUM_SIZE: int = 1000
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
 
 
 class DatabaseSettings(BaseSettings):
     MONGODB_URL: str
+    MONGODB_DATABASE: str = "Ronnia"
+    MONGODB_MAX_POOL_SIZE: int = 100
+    MONGODB_MIN_POOL_SIZE: int = 0
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: Optional[int] = None
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 30000
+    MONGODB_COMPRESSORS: Optional[str] = None
+    MONGODB_ENSURE_INDEXES: bool = True
+    MONGODB_ANALYTICS_READ_PREFERENCE: ReadPreferenceMode = "secondaryPreferred"
+    MONGODB_ANALYTICS_MAX_STALENESS_SECONDS: Optional[int] = None
+    MONGODB_USER_READ_PREFERENCE: ReadPreferenceMode = "primary"
+    ROLLUP_SYNC_INTERVAL_SECONDS: float = 60
+    ROLLUP_HOUR_RETENTION_DAYS: int = 31
+    SETTINGS_POLL_INTERVAL_SECONDS: float = 60
+    TOP_BEATMAPS_FIELDS: Optional[List[str]] = None
+    TOP_BEATMAPS_ALLOW_DISK_USE: bool = False
+    TOP_BEATMAPS_HINTS: Dict[str, str] = {}
+    EXCLUSIONS_CACHE_TTL_SECONDS: float = 60
+    EXCLUSIONS_CACHE_MAX_SIZE: int = 10000
+    WRITE_BEHIND_ENABLED: bool = False
+    WRITE_BEHIND_WINDOW_SECONDS: float = 0.5
+    WRITE_BEHIND_MAX_PENDING_USERS: int = 1000
+    WRITE_BEHIND_DURABILITY: Optional[Literal["enqueue", "flush"]] = None
+
+
+class CacheSettings(BaseSettings):
+    TOP_BEATMAPS_CACHE_TTL_SECONDS: float = 60
+    TOP_BEATMAPS_CACHE_MAX_SIZE: int = 256
+    LIVE_USERS_MAX_AGE_SECONDS: int = 5
+    LIVE_USERS_CACHE_MAX_SIZE: int = 64
+    SHARED_CACHE_DIR: Optional[str] = None
+    SHARED_CACHE_SEGMENT_SIZE: int = 1 << 20
+
+
+class LiveStreamSettings(BaseSettings):
+    LIVE_STREAM_QUEUE_SIZE: int = 100
+    LIVE_STREAM_POLL_INTERVAL_SECONDS: float = 5
+    LIVE_STREAM_KEEPALIVE_SECONDS: float = 15
 
 
 class APISettings(BaseSettings):
@@ -24,15 +87,35 @@ class APISettings(BaseSettings):
     TWITCH_CLIENT_ID: str
     TWITCH_CLIENT_SECRET: str
     TWITCH_REDIRECT_URI: str
+    OSU_BASE_URL: str = "https://osu.ppy.sh"
+    TWITCH_ID_BASE_URL: str = "https://id.twitch.tv"
+    TWITCH_API_BASE_URL: str = "https://api.twitch.tv"
+
+
+class HTTPClientSettings(BaseSettings):
+    HTTP_LIMIT_PER_HOST: int = 20
+    HTTP_DNS_CACHE_TTL_SECONDS: int = 300
+    HTTP_KEEPALIVE_TIMEOUT_SECONDS: float = 30
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5
+    HTTP_READ_TIMEOUT_SECONDS: float = 10
 
 
 class AuthSettings(BaseSettings):
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
+    JWT_CACHE_MAX_SIZE: int = 10000
+    JWT_CACHE_MAX_AGE_SECONDS: float = 300
 
 
 class Settings(
-    CommonSettings, ServerSettings, DatabaseSettings, APISettings, AuthSettings
+    CommonSettings,
+    ServerSettings,
+    DatabaseSettings,
+    CacheSettings,
+    LiveStreamSettings,
+    APISettings,
+    HTTPClientSettings,
+    AuthSettings,
 ):
     pass
 
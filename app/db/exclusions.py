@@ -0,0 +1,121 @@
+import asyncio
+import re
+import weakref
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from bson import Regex
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from app.utils.cache import AsyncTTLCache
+
+CHANNEL_PROJECTION = {"_id": 0, "osuId": 1, "excludedUsers": 1}
+
+
+def normalise_name(name: str) -> str:
+    """Twitch logins are case-insensitive, so names are kept lowercased."""
+    return name.strip().lower()
+
+
+def normalise_names(names: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(normalise_name(name) for name in names if name.strip()))
+
+
+def any_casing(names: Iterable[str]) -> List[Regex]:
+    """Matches names stored before they were normalised, however cased."""
+    return [Regex(f"^{re.escape(name)}$", "i") for name in names]
+
+
+class ChannelExclusions:
+    def __init__(self, osu_id: int, names: Set[str]):
+        self.osu_id = osu_id
+        self.names = names
+        self.stale = False
+
+
+class ExclusionIndex:
+    """Per-channel sets of excluded chatters for membership checks.
+
+    Channels are looked up by Twitch id, loaded on first use and kept for
+    ``ttl`` seconds. Writes made through this process update the cached set in
+    place, writes from other workers show up once the entry expires.
+    """
+
+    def __init__(
+        self, users_collection: AsyncIOMotorCollection, ttl: float, max_size: int
+    ):
+        self.users_collection = users_collection
+        self.cache = AsyncTTLCache(ttl=ttl, max_size=max_size)
+        # The same entries by osu! id, which is what the write paths know.
+        self._by_osu_id: "weakref.WeakValueDictionary[int, ChannelExclusions]" = (
+            weakref.WeakValueDictionary()
+        )
+        # Bumped by every local write, so a load that raced one is refetched.
+        self._generation = 0
+
+    async def _load(self, twitch_id: int) -> Optional[ChannelExclusions]:
+        generation = self._generation
+        user = await self.users_collection.find_one(
+            {"twitchId": twitch_id}, CHANNEL_PROJECTION
+        )
+        if user is None:
+            return None
+        channel = ChannelExclusions(
+            user["osuId"],
+            {normalise_name(name) for name in user.get("excludedUsers", [])},
+        )
+        channel.stale = generation != self._generation
+        self._by_osu_id[channel.osu_id] = channel
+        return channel
+
+    async def channel(self, twitch_id: int) -> Optional[ChannelExclusions]:
+        channel = await self.cache.get_or_set(twitch_id, lambda: self._load(twitch_id))
+        if channel is not None and channel.stale:
+            self.cache.discard(twitch_id)
+            channel = await self.cache.get_or_set(
+                twitch_id, lambda: self._load(twitch_id)
+            )
+        return channel
+
+    async def is_excluded(self, twitch_id: int, name: str) -> Optional[bool]:
+        """Returns ``None`` when the channel is not registered."""
+        channel = await self.channel(twitch_id)
+        if channel is None:
+            return None
+        return normalise_name(name) in channel.names
+
+    async def check_many(self, pairs: List[Tuple[int, str]]) -> List[Optional[bool]]:
+        twitch_ids = list(dict.fromkeys(twitch_id for twitch_id, _ in pairs))
+        loaded = await asyncio.gather(*map(self.channel, twitch_ids))
+        channels = dict(zip(twitch_ids, loaded))
+        results = []
+        for twitch_id, name in pairs:
+            channel = channels[twitch_id]
+            results.append(
+                None if channel is None else normalise_name(name) in channel.names
+            )
+        return results
+
+    def added(self, osu_id: int, names: List[str]):
+        self._generation += 1
+        channel = self._by_osu_id.get(osu_id)
+        if channel is not None:
+            channel.names.update(names)
+
+    def removed(self, osu_id: int, names: List[str]):
+        self._generation += 1
+        channel = self._by_osu_id.get(osu_id)
+        if channel is not None:
+            channel.names.difference_update(names)
+
+    def invalidate(self, osu_id: int):
+        self._generation += 1
+        channel = self._by_osu_id.get(osu_id)
+        if channel is not None:
+            channel.stale = True
+
+    def invalidate_twitch_id(self, twitch_id: int):
+        self._generation += 1
+        self.cache.discard(twitch_id)
+
+    def stats(self) -> Dict[str, int]:
+        return self.cache.stats()
@@ -0,0 +1,200 @@
+import datetime
+import logging
+from typing import Any, AsyncIterator, Dict, List, TYPE_CHECKING
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, IndexModel, monitoring
+from pymongo.errors import OperationFailure
+
+from app.db.mongodb import AsyncMongoClient
+
+if TYPE_CHECKING:
+    from app.config import Settings
+
+logger = logging.getLogger(__name__)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "Users": [
+        IndexModel([("osuId", ASCENDING)], name="osuId_1", unique=True),
+        IndexModel([("twitchId", ASCENDING)], name="twitchId_1"),
+        IndexModel(
+            [("isLive", ASCENDING), ("_id", ASCENDING)],
+            name="isLive_1__id_1",
+            partialFilterExpression={"isLive": True},
+        ),
+    ],
+    "Statistics": [
+        IndexModel([("timestamp", ASCENDING)], name="timestamp_1"),
+    ],
+    "Beatmaps": [
+        IndexModel([("id", ASCENDING)], name="id_1", unique=True),
+    ],
+    "Settings": [
+        IndexModel([("name", ASCENDING)], name="name_1", unique=True),
+    ],
+    "BeatmapRequestRollups": [
+        IndexModel(
+            [
+                ("granularity", ASCENDING),
+                ("bucket", ASCENDING),
+                ("beatmapId", ASCENDING),
+            ],
+            name="granularity_1_bucket_1_beatmapId_1",
+            unique=True,
+        ),
+    ],
+}
+
+# Options that change what an index does; anything else is ignored when checking drift.
+COMPARED_OPTIONS = ("key", "unique", "sparse", "partialFilterExpression")
+
+# The whole Settings catalogue is read on purpose, it only has a handful of rows.
+COLLSCAN_ALLOWED = {"Settings"}
+
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete"}
+
+
+async def ensure_indexes(database: AsyncIOMotorDatabase) -> List[str]:
+    """Creates missing indexes, returns the ones that could not be created.
+
+    Indexes are created one by one, so one that fails, e.g. a unique index
+    over duplicate data, doesn't keep the others from being built.
+    """
+    failed = []
+    for collection_name, indexes in INDEXES.items():
+        collection = database.get_collection(collection_name)
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                await collection.create_indexes([index])
+            except OperationFailure as e:
+                # Also reported as drift until the conflict is resolved.
+                logger.error(
+                    "Could not create index %s.%s: %s", collection_name, name, e
+                )
+                failed.append(f"{collection_name}.{name}")
+        logger.info("Ensured indexes on %s", collection_name)
+    return failed
+
+
+async def find_index_drift(database: AsyncIOMotorDatabase) -> List[str]:
+    """Lists the differences between the declared and the existing indexes."""
+    drift = []
+    for collection_name, indexes in INDEXES.items():
+        existing = await database.get_collection(collection_name).index_information()
+        existing.pop("_id_", None)
+
+        for index in indexes:
+            declared = dict(index.document)
+            name = declared.pop("name")
+            declared["key"] = list(declared["key"].items())
+            current = existing.pop(name, None)
+            if current is None:
+                drift.append(f"{collection_name}.{name} is missing")
+                continue
+            for option in COMPARED_OPTIONS:
+                if declared.get(option) != current.get(option):
+                    drift.append(
+                        f"{collection_name}.{name} has {option}={current.get(option)}, "
+                        f"expected {declared.get(option)}"
+                    )
+
+        for name in existing:
+            drift.append(f"{collection_name}.{name} is not declared")
+
+    for line in drift:
+        logger.warning("Index drift: %s", line)
+    return drift
+
+
+class CommandRecorder(monitoring.CommandListener):
+    def __init__(self):
+        self.commands: List[dict] = []
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if event.command_name in EXPLAINABLE_COMMANDS:
+            command = {
+                key: value
+                for key, value in event.command.items()
+                if not key.startswith("$") and key not in ("lsid", "txnNumber")
+            }
+            self.commands.append(command)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        pass
+
+
+def _find_stages(plan: Any, stage: str) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == stage:
+            return True
+        return any(_find_stages(value, stage) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_find_stages(value, stage) for value in plan)
+    return False
+
+
+async def _drain(iterator: AsyncIterator):
+    async for _ in iterator:
+        pass
+
+
+async def _run_query_methods(mongo_db: AsyncMongoClient):
+    # Ids that never exist, so the write paths below match nothing.
+    missing_id = -1
+    past = datetime.datetime(2000, 1, 1)
+    calls = [
+        mongo_db.get_live_user_names(limit=5, offset=0),
+        mongo_db.get_user_from_twitch_id(missing_id),
+        mongo_db.get_user_from_osu_id(missing_id),
+        _drain(mongo_db.iter_users_by_ids("twitchId", [missing_id])),
+        _drain(mongo_db.iter_users_by_ids("osuId", [missing_id])),
+        mongo_db.get_user_settings(missing_id),
+        mongo_db.get_excluded_users(missing_id),
+        mongo_db.add_excluded_user(missing_id, ""),
+        mongo_db.remove_excluded_user(missing_id, ""),
+        mongo_db.remove_user_by_twitch_id(missing_id),
+        mongo_db.remove_user_by_osu_id(missing_id),
+        mongo_db.get_top_requested_beatmaps(limit=5, offset=0, time_start=past),
+        mongo_db.beatmap_rollup.get_top_requested_beatmaps(
+            limit=5, offset=0, time_start=past
+        ),
+        mongo_db.beatmap_rollup.rebuild(past, past),
+    ]
+    for call in calls:
+        try:
+            await call
+        except Exception as e:
+            # Only the issued commands matter here, not the results.
+            logger.debug("Query method failed during plan verification: %s", e)
+
+
+async def verify_query_plans(settings: "Settings") -> List[str]:
+    """Runs every query method and explains the commands it sent.
+
+    Returns a line for each command whose plan contains a collection scan.
+    """
+    recorder = CommandRecorder()
+    mongo_db = AsyncMongoClient.from_settings(settings, event_listeners=[recorder])
+    try:
+        await _run_query_methods(mongo_db)
+        offenders = []
+        for command in recorder.commands:
+            command_name = next(iter(command))
+            collection_name = command[command_name]
+            if collection_name in COLLSCAN_ALLOWED:
+                continue
+            plan = await mongo_db.users_db.command(
+                {"explain": command, "verbosity": "queryPlanner"}
+            )
+            if _find_stages(plan, "COLLSCAN"):
+                offenders.append(f"{command_name} on {collection_name}: {command}")
+    finally:
+        mongo_db.close()
+
+    for line in offenders:
+        logger.warning("Collection scan: %s", line)
+    return offenders
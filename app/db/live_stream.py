@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.db.settings_catalogue import CHANGE_STREAMS_UNSUPPORTED, RETRY_DELAY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+LIVE_CHANGES_PIPELINE = [
+    {
+        "$match": {
+            "$or": [
+                {"operationType": {"$in": ["insert", "replace", "delete"]}},
+                {"updateDescription.updatedFields.isLive": {"$exists": True}},
+                {"updateDescription.updatedFields.twitchUsername": {"$exists": True}},
+            ]
+        }
+    },
+    {
+        "$project": {
+            "operationType": 1,
+            "documentKey": 1,
+            "fullDocument.isLive": 1,
+            "fullDocument.twitchUsername": 1,
+        }
+    },
+]
+
+
+class LiveStreamHub:
+    """Fans one watcher of live ``Users`` out to every connected client.
+
+    Subscribers get a snapshot of the live twitch usernames followed by join
+    and leave events. A subscriber whose queue fills up is dropped and gets
+    ``None`` as its last item, so it can reconnect and start from a new
+    snapshot.
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection):
+        self._collection = collection
+        self._live: Dict[ObjectId, str] = {}
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, queue_size: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=max(queue_size, 1))
+        queue.put_nowait({"event": "snapshot", "users": list(self._live.values())})
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _publish(self, event: dict):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.info("Dropping a live stream subscriber that fell behind.")
+                self._close(queue)
+
+    def _close(self, queue: asyncio.Queue):
+        """Ends a subscription, dropping whatever it has not read yet."""
+        self._subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    def _set_live(self, user_id: ObjectId, username: Optional[str]):
+        previous = self._live.get(user_id)
+        if previous == username:
+            return
+        if previous is not None:
+            del self._live[user_id]
+            self._publish({"event": "leave", "user": previous})
+        if username is not None:
+            self._live[user_id] = username
+            self._publish({"event": "join", "user": username})
+
+    async def load(self):
+        """Replaces the snapshot, publishing the differences to subscribers."""
+        users = await self._collection.find(
+            {"isLive": True}, {"twitchUsername": 1}
+        ).to_list(length=None)
+        live = {user["_id"]: user.get("twitchUsername") for user in users}
+        for user_id in list(self._live):
+            if user_id not in live:
+                self._set_live(user_id, None)
+        for user_id, username in live.items():
+            self._set_live(user_id, username)
+        logger.debug("Loaded %d live users.", len(self._live))
+
+    def start(self, poll_interval: float):
+        self._task = asyncio.create_task(self._refresh_forever(poll_interval))
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for queue in list(self._subscribers):
+            self._close(queue)
+
+    async def _refresh_forever(self, poll_interval: float):
+        while True:
+            try:
+                await self._watch()
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logger.info("Change streams are unavailable, polling live users.")
+                    await self._poll(poll_interval)
+                logger.exception("Live users change stream failed, reopening it")
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+            except PyMongoError:
+                logger.exception("Live users change stream failed, reopening it")
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+
+    async def _watch(self):
+        async with self._collection.watch(
+            LIVE_CHANGES_PIPELINE, full_document="updateLookup"
+        ) as stream:
+            # Diff once the stream is open so no change in between is missed.
+            await self.load()
+            async for change in stream:
+                user_id = change["documentKey"]["_id"]
+                user = change.get("fullDocument") or {}
+                if change["operationType"] != "delete" and user.get("isLive"):
+                    self._set_live(user_id, user.get("twitchUsername"))
+                else:
+                    self._set_live(user_id, None)
+
+    async def _poll(self, poll_interval: float):
+        while True:
+            await asyncio.sleep(poll_interval)
+            try:
+                await self.load()
+            except PyMongoError:
+                logger.exception("Failed to reload live users")
@@ -1,144 +1,360 @@
 import datetime
 import logging
-from typing import List
+from functools import lru_cache
+from typing import (
+    AsyncIterator,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    TYPE_CHECKING,
+)
 
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
+from pydantic import BaseModel
 from pymongo.errors import BulkWriteError
+from pymongo.read_preferences import Primary, SecondaryPreferred, _ServerMode
 
-from app.models.db import DBUser, DBSetting
+from app.db.exclusions import ExclusionIndex, any_casing, normalise_names
+from app.db.live_stream import LiveStreamHub
+from app.db.read_preferences import read_preference
+from app.db.rollup import BeatmapRequestRollup
+from app.db.settings_catalogue import SettingsCatalogue
+from app.db.top_beatmaps import TopBeatmapsQuery
+from app.db.write_behind import UserWriteQueue
+from app.models.db import (
+    DBUser,
+    DBSetting,
+    ExcludedUsers,
+    UserRevision,
+    UserSettings,
+)
+from app.utils.pagination import MAX_PAGE_LIMIT
+
+if TYPE_CHECKING:
+    from app.config import Settings
 
 logger = logging.getLogger(__name__)
 
+UserModel = TypeVar("UserModel", bound=BaseModel)
+
+# Every write to a user document bumps its version, which the read endpoints
+# use as their ETag.
+VERSION_BUMP = {"$inc": {"version": 1}, "$currentDate": {"updatedAt": True}}
+
+
+@lru_cache
+def projection_for(model: Type[BaseModel]) -> Dict[str, int]:
+    """Projects a document down to the fields ``model`` reads."""
+    projection = {field.alias: 1 for field in model.__fields__.values()}
+    projection.setdefault("_id", 0)
+    return projection
+
 
 class AsyncMongoClient(AsyncIOMotorClient):
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        database_name: str = "Ronnia",
+        top_beatmaps_query: Optional[TopBeatmapsQuery] = None,
+        exclusions_ttl: float = 60,
+        exclusions_max_size: int = 10000,
+        write_behind_window: Optional[float] = None,
+        write_behind_max_pending: int = 1000,
+        write_behind_wait_for_flush: bool = False,
+        rollup_hour_retention: datetime.timedelta = datetime.timedelta(days=31),
+        analytics_read_preference: _ServerMode = SecondaryPreferred(),
+        user_read_preference: _ServerMode = Primary(),
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
-        self.users_db = self.get_database("Ronnia")
+        self.users_db = self.get_database(database_name)
+        # Analytics tolerate replication lag, so they can be served by
+        # secondaries. Users read their own writes, so by default from the primary.
+        self.analytics_db = self.users_db.with_options(
+            read_preference=analytics_read_preference
+        )
         self.statistics_collection = self.users_db.get_collection("Statistics")
+        self.analytics_statistics_collection = self.analytics_db.get_collection(
+            "Statistics"
+        )
         self.beatmaps_collection = self.users_db.get_collection("Beatmaps")
-        self.users_collection = self.users_db.get_collection("Users")
+        self.users_collection = self.users_db.get_collection(
+            "Users", read_preference=user_read_preference
+        )
+        self.live_users_collection = self.analytics_db.get_collection("Users")
         self.settings_collection = self.users_db.get_collection("Settings")
+        self.top_beatmaps_query = top_beatmaps_query or TopBeatmapsQuery(
+            beatmaps_collection=self.beatmaps_collection.name
+        )
+        self.beatmap_rollup = BeatmapRequestRollup(
+            self.users_db,
+            self.top_beatmaps_query,
+            self.analytics_db,
+            rollup_hour_retention,
+        )
+        self.settings_catalogue = SettingsCatalogue(self.settings_collection)
+        self.live_stream = LiveStreamHub(self.users_collection)
+        self.exclusions = ExclusionIndex(
+            self.users_collection, exclusions_ttl, exclusions_max_size
+        )
+        self.write_queue: Optional[UserWriteQueue] = None
+        if write_behind_window is not None:
+            self.write_queue = UserWriteQueue(
+                self.users_collection,
+                VERSION_BUMP,
+                write_behind_window,
+                write_behind_max_pending,
+                write_behind_wait_for_flush,
+            )
+
+    @classmethod
+    def from_settings(
+        cls, settings: "Settings", event_listeners: Sequence = ()
+    ) -> "AsyncMongoClient":
+        kwargs = {}
+        durability = settings.WRITE_BEHIND_DURABILITY
+        if durability is None:
+            # Pending edits are only visible to the worker that queued them,
+            # so with several workers edits are answered once they are stored.
+            durability = "flush" if settings.WEB_CONCURRENCY > 1 else "enqueue"
+        if settings.MONGODB_COMPRESSORS:
+            kwargs["compressors"] = settings.MONGODB_COMPRESSORS
+        return cls(
+            settings.MONGODB_URL,
+            database_name=settings.MONGODB_DATABASE,
+            top_beatmaps_query=TopBeatmapsQuery.from_settings(settings),
+            exclusions_ttl=settings.EXCLUSIONS_CACHE_TTL_SECONDS,
+            exclusions_max_size=settings.EXCLUSIONS_CACHE_MAX_SIZE,
+            write_behind_window=(
+                settings.WRITE_BEHIND_WINDOW_SECONDS
+                if settings.WRITE_BEHIND_ENABLED
+                else None
+            ),
+            write_behind_max_pending=settings.WRITE_BEHIND_MAX_PENDING_USERS,
+            write_behind_wait_for_flush=durability == "flush",
+            rollup_hour_retention=datetime.timedelta(
+                days=settings.ROLLUP_HOUR_RETENTION_DAYS
+            ),
+            analytics_read_preference=read_preference(
+                settings.MONGODB_ANALYTICS_READ_PREFERENCE,
+                settings.MONGODB_ANALYTICS_MAX_STALENESS_SECONDS,
+            ),
+            user_read_preference=read_preference(settings.MONGODB_USER_READ_PREFERENCE),
+            maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+            waitQueueTimeoutMS=settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+            serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+            event_listeners=list(event_listeners),
+            **kwargs,
+        )
 
-    async def get_live_users(self, limit: int, offset: int) -> List[DBUser]:
-        logger.info("Getting live users")
+    async def get_live_user_names(
+        self, limit: int, offset: int = 0, after: Optional[ObjectId] = None
+    ) -> Tuple[List[str], Optional[ObjectId]]:
+        """Returns a page of live twitch usernames and the id to continue after."""
+        logger.debug("Getting live users")
+        limit = min(limit, MAX_PAGE_LIMIT)
+        query = {"isLive": True}
+        if after is not None:
+            query["_id"] = {"$gt": after}
         users = (
-            await self.users_collection.find({"isLive": True})
+            await self.live_users_collection.find(query, {"twitchUsername": 1})
+            .sort("_id", 1)
             .skip(offset)
             .limit(limit)
             .to_list(length=limit)
         )
-        return [DBUser(**user) for user in users]
+        last_id = users[-1]["_id"] if len(users) == limit else None
+        return [user["twitchUsername"] for user in users], last_id
 
-    async def get_user_from_twitch_id(self, twitch_id: int) -> DBUser:
-        logger.info(f"Getting user from twitch id: {twitch_id}")
-        user = await self.users_collection.find_one({"twitchId": twitch_id})
+    async def get_user_from_twitch_id(
+        self, twitch_id: int, model: Type[UserModel] = DBUser
+    ) -> Optional[UserModel]:
+        logger.debug("Getting user from twitch id %s", twitch_id)
+        return await self._find_user({"twitchId": twitch_id}, model)
+
+    async def get_user_from_osu_id(
+        self, osu_id: int, model: Type[UserModel] = DBUser
+    ) -> Optional[UserModel]:
+        logger.debug("Getting user from osu! id %s", osu_id)
+        return await self._find_user({"osuId": osu_id}, model)
+
+    def pending_write_sequence(self, osu_id: int) -> int:
+        """Changes with every queued write of a user until it is flushed."""
+        if self.write_queue is None:
+            return 0
+        return self.write_queue.sequence(osu_id)
+
+    async def get_user_with_revision(
+        self, osu_id: int, model: Type[UserModel]
+    ) -> Optional[Tuple[UserModel, UserRevision]]:
+        """Reads a user and the revision its ETag is derived from in one query."""
+        logger.debug("Getting user and revision from osu! id %s", osu_id)
+        projection = {**self._user_projection(model), **projection_for(UserRevision)}
+        user = await self._find_user_document({"osuId": osu_id}, projection)
+        if user is None:
+            return None
+        return model(**user), UserRevision(**user)
+
+    def _user_projection(self, model: Type[BaseModel]) -> Dict[str, int]:
+        projection = projection_for(model)
+        if self.write_queue is not None:
+            # Pending writes are keyed by osu! id.
+            projection = {**projection, "osuId": 1}
+        return projection
+
+    def _overlay_pending(self, user: dict, projection: Dict[str, int]):
+        if self.write_queue is not None:
+            self.write_queue.overlay(user["osuId"], user, projection)
+
+    async def _find_user(
+        self, query: dict, model: Type[UserModel]
+    ) -> Optional[UserModel]:
+        user = await self._find_user_document(query, self._user_projection(model))
         if user is not None:
-            logger.info(f"Found user: {user}")
-            return DBUser(**user)
-        logger.info("User not found")
+            return model(**user)
 
-    async def get_user_from_osu_id(self, osu_id: int) -> DBUser:
-        logger.info(f"Getting user from osu id: {osu_id}")
-        user = await self.users_collection.find_one({"osuId": osu_id})
+    async def _find_user_document(
+        self, query: dict, projection: Dict[str, int]
+    ) -> Optional[dict]:
+        user = await self.users_collection.find_one(query, projection)
         if user is not None:
-            logger.info(f"Found user: {user}")
-            return DBUser(**user)
-        logger.info("User not found")
+            logger.debug("Found user %s", query)
+            self._overlay_pending(user, projection)
+            return user
+        logger.debug("User %s not found", query)
+
+    async def iter_users_by_ids(
+        self, key: str, ids: Sequence[int], model: Type[UserModel] = DBUser
+    ) -> AsyncIterator[Tuple[int, UserModel]]:
+        """Yields ``(id, user)`` for each of ``ids`` found under ``key``, in one query."""
+        logger.debug("Getting %d users by %s", len(ids), key)
+        projection = {**self._user_projection(model), key: 1}
+        cursor = self.users_collection.find({key: {"$in": list(ids)}}, projection)
+        async for user in cursor:
+            self._overlay_pending(user, projection)
+            yield user[key], model(**user)
 
     async def upsert_user(self, user: dict):
-        logger.info(f"Upserting user: {user}")
-        return await self.users_collection.update_one(
-            {"osuId": user["osuId"]}, {"$set": user}, upsert=True
+        logger.debug("Upserting user %s", user["osuId"])
+        result = await self.users_collection.update_one(
+            {"osuId": user["osuId"]}, {"$set": user, **VERSION_BUMP}, upsert=True
         )
+        self.exclusions.invalidate(user["osuId"])
+        return result
 
     async def remove_user_by_twitch_id(self, twitch_id: int):
-        logger.info(f"Removing user by twitch id: {twitch_id}")
-        return await self.users_collection.delete_one({"twitchId": twitch_id})
+        logger.info("Removing user by twitch id %s", twitch_id)
+        result = await self.users_collection.delete_one({"twitchId": twitch_id})
+        self.exclusions.invalidate_twitch_id(twitch_id)
+        return result
 
     async def remove_user_by_osu_id(self, osu_id: int):
-        logger.info(f"Removing user by osu! id: {osu_id}")
-        return await self.users_collection.delete_one({"osuId": osu_id})
+        logger.info("Removing user by osu! id %s", osu_id)
+        result = await self.users_collection.delete_one({"osuId": osu_id})
+        self.exclusions.invalidate(osu_id)
+        return result
 
     async def bulk_write_operations(self, operations: list, collection: str = "Users"):
-        logger.info(f"Bulk writing {len(operations)} operations..")
+        logger.debug("Bulk writing %d operations", len(operations))
         col = self.users_db.get_collection(collection)
         try:
             result = await col.bulk_write(operations)
             return result
         except BulkWriteError as bwe:
-            logger.error(bwe.details)
+            write_errors = bwe.details.get("writeErrors", [])
+            logger.error(
+                "Bulk write failed with %d errors, first: %s",
+                len(write_errors),
+                write_errors[0].get("errmsg") if write_errors else None,
+            )
 
-    async def get_default_settings(self):
-        logger.info("Getting default settings...")
-        settings = await self.settings_collection.find().to_list(length=100)
-        logger.info(f"Found {len(settings)} settings.")
-        return [DBSetting(**setting) for setting in settings]
+    async def get_user_settings(self, osu_id: int) -> List[DBSetting]:
+        logger.debug("Getting settings of user %s", osu_id)
+        user = await self.get_user_from_osu_id(osu_id, model=UserSettings)
+        return await self.apply_user_settings(user)
 
-    async def get_user_settings(self, osu_id: int):
-        logger.info("Getting user settings...")
-        default_settings = await self.get_default_settings()
-        user = await self.users_collection.find_one({"osuId": osu_id})
-        db_user = DBUser(**user)
-        user_settings_dict = db_user.settings.dict(by_alias=True)
+    async def apply_user_settings(self, user: UserSettings) -> List[DBSetting]:
+        """Fills the default settings in with the values the user chose."""
+        default_settings = await self.settings_catalogue.get()
+        user_settings_dict = user.settings.dict(by_alias=True)
 
+        user_settings = []
         for setting in default_settings:
             if user_settings_dict[setting.name] is not None:
-                setting.value = user_settings_dict[setting.name]
+                setting = setting.copy(
+                    update={"value": user_settings_dict[setting.name]}
+                )
+            user_settings.append(setting)
 
-        return default_settings
+        return user_settings
 
     async def update_user_settings(self, osu_id: int, settings: DBSetting):
-        logger.info(f"Updating user settings: {settings}")
+        logger.debug("Updating settings of user %s", osu_id)
+        user_settings = settings.dict(by_alias=True)
+        if self.write_queue is not None:
+            return await self.write_queue.set_settings(osu_id, user_settings)
         return await self.users_collection.update_one(
-            {"osuId": osu_id}, {"$set": {"settings": settings.dict(by_alias=True)}}
+            {"osuId": osu_id}, {"$set": {"settings": user_settings}, **VERSION_BUMP}
         )
 
     async def remove_excluded_user(self, osu_id: int, excluded_user: str):
-        logger.info(f"Removing excluded user: {excluded_user}")
-        return await self.users_collection.update_one(
-            {"osuId": osu_id}, {"$pull": {"excludedUsers": excluded_user}}
-        )
+        return await self.remove_excluded_users(osu_id, [excluded_user])
+
+    async def remove_excluded_users(self, osu_id: int, excluded_users: List[str]):
+        logger.debug("Removing %d excluded users of %s", len(excluded_users), osu_id)
+        names = normalise_names(excluded_users)
+        if self.write_queue is not None:
+            result = await self.write_queue.remove_excluded_users(osu_id, names)
+        else:
+            result = await self.users_collection.update_one(
+                {"osuId": osu_id},
+                {
+                    "$pull": {"excludedUsers": {"$in": any_casing(names)}},
+                    **VERSION_BUMP,
+                },
+            )
+        self.exclusions.removed(osu_id, names)
+        return result
 
     async def add_excluded_user(self, osu_id: int, excluded_user: str):
-        logger.info(f"Removing excluded user: {excluded_user}")
-        return await self.users_collection.update_one(
-            {"osuId": osu_id}, {"$addToSet": {"excludedUsers": excluded_user}}
-        )
+        return await self.add_excluded_users(osu_id, [excluded_user])
+
+    async def add_excluded_users(self, osu_id: int, excluded_users: List[str]):
+        logger.debug("Adding %d excluded users of %s", len(excluded_users), osu_id)
+        names = normalise_names(excluded_users)
+        if self.write_queue is not None:
+            result = await self.write_queue.add_excluded_users(osu_id, names)
+        else:
+            result = await self.users_collection.update_one(
+                {"osuId": osu_id},
+                {"$addToSet": {"excludedUsers": {"$each": names}}, **VERSION_BUMP},
+            )
+        self.exclusions.added(osu_id, names)
+        return result
 
-    async def get_excluded_users(self, osu_id: int):
-        logger.info(f"Getting excluded users for: {osu_id}")
-        user = await self.users_collection.find_one({"osuId": osu_id})
-        return user["excludedUsers"]
+    async def get_excluded_users(self, osu_id: int) -> List[str]:
+        logger.debug("Getting excluded users of %s", osu_id)
+        user = await self.get_user_from_osu_id(osu_id, model=ExcludedUsers)
+        return user.excludedUsers
 
     async def get_top_requested_beatmaps(
-        self, limit: int, offset: int, time_start: datetime.datetime
+        self,
+        limit: int,
+        offset: int,
+        time_start: datetime.datetime,
+        after: Optional[Tuple[int, int]] = None,
     ):
-        logger.info(f"Getting top requested beatmaps")
-        aggregation = [
+        logger.debug("Getting top requested beatmaps")
+        source = [
             {"$match": {"timestamp": {"$gte": time_start}}},
-            {"$sortByCount": "$requested_beatmap_id"},
-            {
-                "$lookup": {
-                    "from": "Beatmaps",
-                    "localField": "_id",
-                    "foreignField": "id",
-                    "as": "result",
-                }
-            },
-            {
-                "$replaceRoot": {
-                    "newRoot": {
-                        "$mergeObjects": [
-                            {"$arrayElemAt": ["$result", 0]},
-                            "$$ROOT",
-                        ]
-                    }
-                }
-            },
-            {"$skip": offset},
-            {"$limit": limit},
+            {"$group": {"_id": "$requested_beatmap_id", "count": {"$sum": 1}}},
         ]
-        beatmaps = await self.statistics_collection.aggregate(aggregation).to_list(
-            length=limit
+        return await self.top_beatmaps_query.run(
+            self.analytics_statistics_collection, source, limit, offset, after
         )
-        return beatmaps
@@ -0,0 +1,31 @@
+from typing import Optional
+
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+    _ServerMode,
+)
+
+READ_PREFERENCES = {
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def read_preference(mode: str, max_staleness: Optional[int] = None) -> _ServerMode:
+    """Builds a read preference from its connection string name.
+
+    ``max_staleness`` is ignored for ``primary``, which is never stale.
+    """
+    if max_staleness is not None and max_staleness < 90:
+        # MongoDB's minimum, checked here so it fails on startup rather than
+        # on the first query.
+        raise ValueError("maxStalenessSeconds must be at least 90")
+    if mode == "primary":
+        return Primary()
+    return READ_PREFERENCES[mode](max_staleness=max_staleness or -1)
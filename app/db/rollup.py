@@ -0,0 +1,278 @@
+import asyncio
+import datetime
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.db.top_beatmaps import TopBeatmapsQuery
+
+logger = logging.getLogger(__name__)
+
+HOUR = datetime.timedelta(hours=1)
+DAY = datetime.timedelta(days=1)
+
+
+def floor_hour(timestamp: datetime.datetime) -> datetime.datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(timestamp: datetime.datetime) -> datetime.datetime:
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class BeatmapRequestRollup:
+    """Hourly and daily per-beatmap request counts summed from ``Statistics``.
+
+    Buckets are always recomputed from the raw events instead of incremented,
+    so a sync can be repeated or run by several workers at once without
+    double counting. Hour buckets only serve the partial first day of a
+    window, so those older than ``hour_retention`` are pruned on sync.
+    """
+
+    def __init__(
+        self,
+        database: AsyncIOMotorDatabase,
+        top_beatmaps_query: Optional[TopBeatmapsQuery] = None,
+        analytics_database: Optional[AsyncIOMotorDatabase] = None,
+        hour_retention: datetime.timedelta = datetime.timedelta(days=31),
+    ):
+        self.hour_retention = hour_retention
+        self.statistics_collection = database.get_collection("Statistics")
+        self.beatmaps_collection = database.get_collection("Beatmaps")
+        self.rollup_collection = database.get_collection("BeatmapRequestRollups")
+        # Only the top beatmaps reads may be routed elsewhere, syncing relies
+        # on reading its own writes.
+        if analytics_database is None:
+            analytics_database = database
+        self.analytics_rollup_collection = analytics_database.get_collection(
+            self.rollup_collection.name
+        )
+        self.state_collection = database.get_collection("BeatmapRequestRollupState")
+        self.top_beatmaps_query = top_beatmaps_query or TopBeatmapsQuery(
+            beatmaps_collection=self.beatmaps_collection.name
+        )
+
+    async def rebuild(self, start: datetime.datetime, end: datetime.datetime):
+        hour_start, hour_end = floor_hour(start), floor_hour(end) + HOUR
+        day_start, day_end = floor_day(start), floor_day(end) + DAY
+        if day_start < floor_day(datetime.datetime.utcnow() - self.hour_retention):
+            # The day's earlier hours may be pruned, its sum needs them all.
+            hour_start = day_start
+        logger.info(
+            "Rebuilding beatmap request rollups from %s to %s", hour_start, hour_end
+        )
+
+        hourly = [
+            {"$match": {"timestamp": {"$gte": hour_start, "$lt": hour_end}}},
+            {
+                "$group": {
+                    "_id": {
+                        "beatmapId": "$requested_beatmap_id",
+                        "bucket": {
+                            "$dateTrunc": {"date": "$timestamp", "unit": "hour"}
+                        },
+                    },
+                    "count": {"$sum": 1},
+                }
+            },
+            *self._merge_stages("hour"),
+        ]
+        # A backfill groups the whole history, past the in-memory stage limit.
+        await self.statistics_collection.aggregate(hourly, allowDiskUse=True).to_list(
+            length=None
+        )
+
+        # Days are summed from the hour buckets written above, never from raw events.
+        daily = [
+            {
+                "$match": {
+                    "granularity": "hour",
+                    "bucket": {"$gte": day_start, "$lt": day_end},
+                }
+            },
+            {
+                "$group": {
+                    "_id": {
+                        "beatmapId": "$beatmapId",
+                        "bucket": {"$dateTrunc": {"date": "$bucket", "unit": "day"}},
+                    },
+                    "count": {"$sum": "$count"},
+                }
+            },
+            *self._merge_stages("day"),
+        ]
+        await self.rollup_collection.aggregate(daily, allowDiskUse=True).to_list(
+            length=None
+        )
+
+    def _merge_stages(self, granularity: str) -> List[dict]:
+        return [
+            {
+                "$project": {
+                    "_id": 0,
+                    "granularity": {"$literal": granularity},
+                    "bucket": "$_id.bucket",
+                    "beatmapId": "$_id.beatmapId",
+                    "count": 1,
+                }
+            },
+            {
+                "$merge": {
+                    "into": self.rollup_collection.name,
+                    "on": ["granularity", "bucket", "beatmapId"],
+                    "whenMatched": "replace",
+                    "whenNotMatched": "insert",
+                }
+            },
+        ]
+
+    async def backfill(self, since: Optional[datetime.datetime] = None):
+        latest = await self.statistics_collection.find_one(sort=[("_id", -1)])
+        if latest is None:
+            logger.info("No statistics to backfill.")
+            return
+
+        if since is None:
+            oldest = await self.statistics_collection.find_one(sort=[("timestamp", 1)])
+            since = oldest["timestamp"]
+
+        # Record the watermark first so events arriving mid-backfill get synced later.
+        await self._set_watermark(latest["_id"])
+        await self.rebuild(since, datetime.datetime.utcnow())
+
+    async def sync(self):
+        state = await self.state_collection.find_one({"_id": "watermark"})
+        now = datetime.datetime.utcnow()
+        if state is None:
+            logger.warning("Beatmap request rollups were never backfilled.")
+            latest = await self.statistics_collection.find_one(sort=[("_id", -1)])
+            if latest is not None:
+                await self._set_watermark(latest["_id"])
+            await self.rebuild(now - HOUR, now)
+            return
+
+        pending = await self.statistics_collection.aggregate(
+            [
+                {"$match": {"_id": {"$gt": state["lastId"]}}},
+                {
+                    "$group": {
+                        "_id": None,
+                        "lastId": {"$max": "$_id"},
+                        "start": {"$min": "$timestamp"},
+                        "end": {"$max": "$timestamp"},
+                    }
+                },
+            ]
+        ).to_list(length=1)
+
+        # The previous hour is always recomputed to pick up events whose ids
+        # were generated slightly out of order by different writers.
+        start, end = now - HOUR, now
+        if pending:
+            start = min(start, pending[0]["start"])
+            end = max(end, pending[0]["end"])
+        await self.rebuild(start, end)
+
+        if pending:
+            await self._set_watermark(pending[0]["lastId"])
+        await self.prune(now)
+
+    async def prune(self, now: datetime.datetime):
+        """Deletes hour buckets older than any window reads."""
+        cutoff = floor_day(now - self.hour_retention)
+        result = await self.rollup_collection.delete_many(
+            {"granularity": "hour", "bucket": {"$lt": cutoff}}
+        )
+        if result.deleted_count:
+            logger.info(
+                "Pruned %d hour buckets before %s", result.deleted_count, cutoff
+            )
+
+    async def _set_watermark(self, last_id):
+        await self.state_collection.update_one(
+            {"_id": "watermark"},
+            {"$set": {"lastId": last_id, "updatedAt": datetime.datetime.utcnow()}},
+            upsert=True,
+        )
+
+    async def run_forever(self, interval: float):
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to sync beatmap request rollups")
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def _window_match(time_start: datetime.datetime) -> dict:
+        # Whole days come from day buckets, the partial first day from hours.
+        hour_start = floor_hour(time_start)
+        first_full_day = floor_day(hour_start)
+        if first_full_day < hour_start:
+            first_full_day += DAY
+        return {
+            "$or": [
+                {
+                    "granularity": "hour",
+                    "bucket": {"$gte": hour_start, "$lt": first_full_day},
+                },
+                {"granularity": "day", "bucket": {"$gte": first_full_day}},
+            ]
+        }
+
+    async def get_top_requested_beatmaps(
+        self,
+        limit: int,
+        offset: int,
+        time_start: datetime.datetime,
+        after: Optional[Tuple[int, int]] = None,
+    ):
+        logger.debug("Getting top requested beatmaps from rollups")
+        source = [
+            {"$match": self._window_match(time_start)},
+            {"$group": {"_id": "$beatmapId", "count": {"$sum": "$count"}}},
+        ]
+        return await self.top_beatmaps_query.run(
+            self.analytics_rollup_collection, source, limit, offset, after
+        )
+
+    async def check_consistency(self, time_start: datetime.datetime) -> Dict[int, dict]:
+        """Compares rollup counts with the raw ``Statistics`` aggregation.
+
+        ``time_start`` is floored to the hour, the rollup resolution. Returns
+        the beatmaps whose counts differ, keyed by beatmap id.
+        """
+        time_start = floor_hour(time_start)
+        raw = await self.statistics_collection.aggregate(
+            [
+                {"$match": {"timestamp": {"$gte": time_start}}},
+                {"$sortByCount": "$requested_beatmap_id"},
+            ],
+            allowDiskUse=True,
+        ).to_list(length=None)
+        rolled = await self.rollup_collection.aggregate(
+            [
+                {"$match": self._window_match(time_start)},
+                {"$group": {"_id": "$beatmapId", "count": {"$sum": "$count"}}},
+            ],
+            allowDiskUse=True,
+        ).to_list(length=None)
+
+        raw_counts = {row["_id"]: row["count"] for row in raw}
+        rollup_counts = {row["_id"]: row["count"] for row in rolled}
+        mismatches = {}
+        for beatmap_id in raw_counts.keys() | rollup_counts.keys():
+            raw_count = raw_counts.get(beatmap_id, 0)
+            rollup_count = rollup_counts.get(beatmap_id, 0)
+            if raw_count != rollup_count:
+                mismatches[beatmap_id] = {"raw": raw_count, "rollup": rollup_count}
+
+        logger.info(
+            "Checked %d beatmaps, found %d mismatches.",
+            len(raw_counts),
+            len(mismatches),
+        )
+        return mismatches
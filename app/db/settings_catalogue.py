@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+import logging
+from typing import Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.models.db import DBSetting
+
+logger = logging.getLogger(__name__)
+
+# Returned by servers that are not part of a replica set.
+CHANGE_STREAMS_UNSUPPORTED = 40573
+RETRY_DELAY_SECONDS = 5
+
+
+class SettingsCatalogue:
+    """In-memory snapshot of the default ``Settings`` documents.
+
+    The snapshot is a tuple that is replaced as a whole on every reload and
+    must not be modified by callers; copy a setting before changing it.
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection):
+        self._collection = collection
+        self._snapshot: Optional[Tuple[DBSetting, ...]] = None
+        # Changes whenever the loaded settings do, across processes too.
+        self.fingerprint: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self) -> Tuple[DBSetting, ...]:
+        settings = await self._collection.find().to_list(length=100)
+        self._snapshot = tuple(DBSetting(**setting) for setting in settings)
+        self.fingerprint = hashlib.blake2b(
+            repr([setting.dict() for setting in self._snapshot]).encode(),
+            digest_size=8,
+        ).hexdigest()
+        logger.info("Loaded %d default settings.", len(self._snapshot))
+        return self._snapshot
+
+    async def get(self) -> Tuple[DBSetting, ...]:
+        if self._snapshot is None:
+            return await self.load()
+        return self._snapshot
+
+    def start(self, poll_interval: float):
+        self._task = asyncio.create_task(self._refresh_forever(poll_interval))
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _refresh_forever(self, poll_interval: float):
+        while True:
+            try:
+                await self._watch()
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logger.info("Change streams are unavailable, polling settings.")
+                    await self._poll(poll_interval)
+                logger.exception("Settings change stream failed, reopening it")
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+            except PyMongoError:
+                logger.exception("Settings change stream failed, reopening it")
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+
+    async def _watch(self):
+        async with self._collection.watch() as stream:
+            # Reload once the stream is open so no change in between is missed.
+            await self.load()
+            async for _ in stream:
+                await self.load()
+
+    async def _poll(self, poll_interval: float):
+        while True:
+            await asyncio.sleep(poll_interval)
+            try:
+                await self.load()
+            except PyMongoError:
+                logger.exception("Failed to reload default settings")
@@ -0,0 +1,136 @@
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from app.utils.pagination import MAX_PAGE_LIMIT
+
+if TYPE_CHECKING:
+    from app.config import DatabaseSettings
+
+# Beatmap fields the site renders for a top list entry; failtimes and the
+# rest of the osu! API payload are left in the database.
+RENDERED_BEATMAP_FIELDS = (
+    "id",
+    "beatmapset_id",
+    "mode",
+    "version",
+    "difficulty_rating",
+    "total_length",
+    "url",
+    "beatmapset.artist",
+    "beatmapset.title",
+    "beatmapset.creator",
+    "beatmapset.covers",
+)
+
+
+def count_keyset_stages(after: Optional[Tuple[int, int]]) -> List[dict]:
+    """Orders grouped beatmap counts and resumes after a ``(count, id)`` key."""
+    stages = []
+    if after is not None:
+        count, beatmap_id = after
+        stages.append(
+            {
+                "$match": {
+                    "$or": [
+                        {"count": {"$lt": count}},
+                        {"count": count, "_id": {"$gt": beatmap_id}},
+                    ]
+                }
+            }
+        )
+    stages.append({"$sort": {"count": -1, "_id": 1}})
+    return stages
+
+
+class TopBeatmapsQuery:
+    """Builds the aggregation that ranks beatmaps and joins their details.
+
+    The source stages group some collection into ``{_id: beatmapId, count}``
+    rows; this adds ordering, pagination and the ``Beatmaps`` join. By default
+    the page is cut before the join, so only ``limit`` beatmaps are looked up,
+    and the lookup only carries ``fields`` back.
+    """
+
+    def __init__(
+        self,
+        beatmaps_collection: str = "Beatmaps",
+        fields: Optional[Sequence[str]] = RENDERED_BEATMAP_FIELDS,
+        allow_disk_use: bool = False,
+        hints: Optional[Dict[str, str]] = None,
+        paginate_before_join: bool = True,
+    ):
+        self.beatmaps_collection = beatmaps_collection
+        self.fields = fields
+        self.allow_disk_use = allow_disk_use
+        self.hints = hints or {}
+        self.paginate_before_join = paginate_before_join
+
+    @classmethod
+    def from_settings(cls, settings: "DatabaseSettings") -> "TopBeatmapsQuery":
+        fields = settings.TOP_BEATMAPS_FIELDS
+        if fields is None:
+            fields = RENDERED_BEATMAP_FIELDS
+        return cls(
+            # An empty list joins whole beatmap documents.
+            fields=fields or None,
+            allow_disk_use=settings.TOP_BEATMAPS_ALLOW_DISK_USE,
+            hints=settings.TOP_BEATMAPS_HINTS,
+        )
+
+    def join_stages(self) -> List[dict]:
+        lookup = {
+            "from": self.beatmaps_collection,
+            "localField": "_id",
+            "foreignField": "id",
+            "as": "beatmap",
+        }
+        if self.fields:
+            projection = {"_id": 0, **{field: 1 for field in self.fields}}
+            lookup["pipeline"] = [{"$limit": 1}, {"$project": projection}]
+        return [
+            {"$lookup": lookup},
+            {
+                "$replaceRoot": {
+                    "newRoot": {
+                        "$mergeObjects": [
+                            {"$arrayElemAt": ["$beatmap", 0]},
+                            {"_id": "$_id", "count": "$count"},
+                        ]
+                    }
+                }
+            },
+        ]
+
+    def pipeline(
+        self,
+        source_stages: List[dict],
+        limit: int,
+        offset: int,
+        after: Optional[Tuple[int, int]] = None,
+    ) -> List[dict]:
+        page = [{"$skip": offset}, {"$limit": limit}]
+        ranked = [*source_stages, *count_keyset_stages(after)]
+        if self.paginate_before_join:
+            return [*ranked, *page, *self.join_stages()]
+        return [*ranked, *self.join_stages(), *page]
+
+    def options(self, collection_name: str) -> dict:
+        options = {"allowDiskUse": self.allow_disk_use}
+        hint = self.hints.get(collection_name)
+        if hint is not None:
+            options["hint"] = hint
+        return options
+
+    async def run(
+        self,
+        collection: AsyncIOMotorCollection,
+        source_stages: List[dict],
+        limit: int,
+        offset: int,
+        after: Optional[Tuple[int, int]] = None,
+    ) -> List[dict]:
+        limit = min(limit, MAX_PAGE_LIMIT)
+        pipeline = self.pipeline(source_stages, limit, offset, after)
+        cursor = collection.aggregate(pipeline, **self.options(collection.name))
+        return await cursor.to_list(length=limit)
@@ -0,0 +1,247 @@
+import asyncio
+import itertools
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from app.db.exclusions import any_casing, normalise_name
+
+logger = logging.getLogger(__name__)
+
+
+class PendingUserWrite:
+    """Everything written to one user since the last flush, merged."""
+
+    def __init__(self):
+        self.settings: Optional[dict] = None
+        # Dicts are used as insertion ordered sets of normalised names; the
+        # two never share a name.
+        self.added: Dict[str, None] = {}
+        self.removed: Dict[str, None] = {}
+        self.sequence = 0
+        self.waiters: List[asyncio.Future] = []
+
+    def add(self, names: Iterable[str]):
+        for name in names:
+            self.removed.pop(name, None)
+            self.added[name] = None
+
+    def remove(self, names: Iterable[str]):
+        for name in names:
+            self.added.pop(name, None)
+            self.removed[name] = None
+
+    def absorb(self, newer: "PendingUserWrite"):
+        """Applies ``newer`` on top of this write, for retrying a failed flush."""
+        if newer.settings is not None:
+            self.settings = newer.settings
+        self.remove(newer.removed)
+        self.add(newer.added)
+        self.sequence = newer.sequence
+        self.waiters.extend(newer.waiters)
+
+    def operations(self, osu_id: int, version_bump: dict) -> List[UpdateOne]:
+        # $addToSet and $pull can't touch the same field in one update, the
+        # names never overlap so the two updates commute.
+        operations = []
+        update = {}
+        if self.settings is not None:
+            update["$set"] = {"settings": self.settings}
+        if self.added:
+            update["$addToSet"] = {"excludedUsers": {"$each": list(self.added)}}
+        if update:
+            operations.append(UpdateOne({"osuId": osu_id}, {**update, **version_bump}))
+        if self.removed:
+            pull = {"$pull": {"excludedUsers": {"$in": any_casing(self.removed)}}}
+            operations.append(UpdateOne({"osuId": osu_id}, {**pull, **version_bump}))
+        return operations
+
+    def overlay(self, user: dict, fields: Iterable[str]):
+        if self.settings is not None and "settings" in fields:
+            user["settings"] = self.settings
+        if (self.added or self.removed) and "excludedUsers" in fields:
+            names = [
+                name
+                for name in user.get("excludedUsers", [])
+                if normalise_name(name) not in self.removed
+            ]
+            names += [name for name in self.added if name not in names]
+            user["excludedUsers"] = names
+
+    def resolve(self, error: Optional[BaseException] = None):
+        for waiter in self.waiters:
+            if waiter.done():
+                continue
+            if error is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(error)
+        self.waiters.clear()
+
+
+class UserWriteQueue:
+    """Write-behind buffer for user settings and excluded users.
+
+    Writes to the same user within ``window`` seconds are merged and all
+    pending users are flushed in one unordered ``bulk_write``. With
+    ``wait_for_flush`` writers are only answered once their write is stored,
+    otherwise as soon as it is queued. Reads overlay pending writes through
+    ``overlay`` so users always see their own changes.
+    """
+
+    def __init__(
+        self,
+        collection: AsyncIOMotorCollection,
+        version_bump: dict,
+        window: float,
+        max_pending: int,
+        wait_for_flush: bool = False,
+    ):
+        self.collection = collection
+        self.version_bump = version_bump
+        self.window = window
+        self.max_pending = max_pending
+        self.wait_for_flush = wait_for_flush
+        self._pending: Dict[int, PendingUserWrite] = {}
+        # Taken out of _pending by a flush but not acknowledged yet.
+        self._flushing: Dict[int, PendingUserWrite] = {}
+        self._sequence = itertools.count(1)
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def set_settings(self, osu_id: int, settings: dict):
+        pending = self._pending_for(osu_id)
+        pending.settings = settings
+        await self._enqueued(pending)
+
+    async def add_excluded_users(self, osu_id: int, names: List[str]):
+        pending = self._pending_for(osu_id)
+        pending.add(names)
+        await self._enqueued(pending)
+
+    async def remove_excluded_users(self, osu_id: int, names: List[str]):
+        pending = self._pending_for(osu_id)
+        pending.remove(names)
+        await self._enqueued(pending)
+
+    def _pending_for(self, osu_id: int) -> PendingUserWrite:
+        pending = self._pending.get(osu_id)
+        if pending is None:
+            pending = self._pending[osu_id] = PendingUserWrite()
+        pending.sequence = next(self._sequence)
+        return pending
+
+    async def _enqueued(self, pending: PendingUserWrite):
+        if self._task is None:
+            # Not running in the app, e.g. from a script, so write through.
+            await self.flush()
+            return
+        if len(self._pending) >= self.max_pending:
+            self._full.set()
+        if self.wait_for_flush:
+            waiter = asyncio.get_running_loop().create_future()
+            pending.waiters.append(waiter)
+            await waiter
+
+    def sequence(self, osu_id: int) -> int:
+        """Identifies the pending writes of a user, ``0`` when there are none."""
+        for writes in (self._pending, self._flushing):
+            pending = writes.get(osu_id)
+            if pending is not None:
+                return pending.sequence
+        return 0
+
+    def overlay(self, osu_id: int, user: dict, fields: Iterable[str]):
+        for writes in (self._flushing, self._pending):
+            pending = writes.get(osu_id)
+            if pending is not None:
+                pending.overlay(user, fields)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            try:
+                await self._write(self._flushing)
+            finally:
+                self._flushing = {}
+
+    async def _write(self, batch: Dict[int, PendingUserWrite]):
+        operations, owners = [], []
+        for osu_id, pending in batch.items():
+            for operation in pending.operations(osu_id, self.version_bump):
+                operations.append(operation)
+                owners.append(osu_id)
+        if not operations:
+            for pending in batch.values():
+                pending.resolve()
+            return
+
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as bwe:
+            write_errors = bwe.details.get("writeErrors", [])
+            logger.error(
+                "Flushing user writes failed with %d errors, first: %s",
+                len(write_errors),
+                write_errors[0].get("errmsg") if write_errors else None,
+            )
+            failed = {owners[error["index"]] for error in write_errors}
+            for osu_id, pending in batch.items():
+                pending.resolve(bwe if osu_id in failed else None)
+            return
+        except PyMongoError:
+            logger.exception(
+                "Flushing writes of %d users failed, requeueing", len(batch)
+            )
+            for osu_id, pending in batch.items():
+                newer = self._pending.get(osu_id)
+                if newer is not None:
+                    pending.absorb(newer)
+                self._pending[osu_id] = pending
+            raise
+
+        logger.debug("Flushed %d writes of %d users", len(operations), len(batch))
+        for pending in batch.values():
+            pending.resolve()
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._flush_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            # Not cancelled, a flush cut short could lose the batch it took.
+            self._stopping = True
+            self._full.set()
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except PyMongoError as e:
+            logger.error("Dropping pending writes of %d users", len(self._pending))
+            for pending in self._pending.values():
+                pending.resolve(e)
+            self._pending.clear()
+
+    async def _flush_forever(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except PyMongoError:
+                # Already requeued and logged, retried on the next window.
+                pass
@@ -0,0 +1,21 @@
+import hmac
+from typing import Optional
+
+from fastapi.requests import Request
+
+from app.db.mongodb import AsyncMongoClient
+from app.utils.http import UpstreamHTTPClient
+
+
+def get_mongo_db(request: Request) -> AsyncMongoClient:
+    return request.app.state.mongo_db
+
+
+def get_http_client(request: Request) -> UpstreamHTTPClient:
+    return request.app.state.http_client
+
+
+def bearer_token_matches(authorization: Optional[str], token: Optional[str]) -> bool:
+    if authorization is None or not token:
+        return False
+    return hmac.compare_digest(authorization, f"Bearer {token}")
@@ -1,24 +1,101 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager, suppress
+from typing import Awaitable
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import sentry_sdk
 
 from app.config import settings
-from app.routers import oauth, user, live, requests
+from app.db.indexes import ensure_indexes, find_index_drift
+from app.db.mongodb import AsyncMongoClient
+from app.routers import oauth, user, live, requests, metrics, bot
+from app.routers.live import live_users_cache
+from app.routers.requests import top_beatmaps_cache
+from app.utils.compression import CompressionMiddleware
+from app.utils.http import UpstreamHTTPClient
+from app.utils.jwt import token_cache
+from app.utils.logs import RequestIdMiddleware, configure_logging
+from app.utils.metrics import (
+    REGISTRY,
+    CacheCollector,
+    MongoCommandMetrics,
+    MongoPoolMetrics,
+    PrometheusMiddleware,
+    mark_process_dead,
+)
+from app.utils.responses import FastJSONResponse
+from app.utils.sentry import init_sentry
 
 logger = logging.getLogger(__name__)
 
-sentry_sdk.init(
-    dsn=settings.SENTRY_DSN,
-    traces_sample_rate=1.0,
-)
+init_sentry(settings)
+
+
+async def shutdown_step(name: str, step: Awaitable):
+    """Runs one cleanup step, so a failing one doesn't skip the rest."""
+    try:
+        await step
+    except Exception:
+        logger.exception("Failed to stop the %s", name)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_listener = configure_logging(settings)
+    log_listener.start()
+    mongo_db = AsyncMongoClient.from_settings(
+        settings, event_listeners=[MongoCommandMetrics(), MongoPoolMetrics()]
+    )
+    app.state.mongo_db = mongo_db
+    cache_collector.caches["exclusions"] = mongo_db.exclusions.stats
+    # Connects on the first osu! or Twitch call, not before serving.
+    http_client = UpstreamHTTPClient.from_settings(settings)
+    app.state.http_client = http_client
+
+    if settings.MONGODB_ENSURE_INDEXES:
+        await ensure_indexes(mongo_db.users_db)
+    await find_index_drift(mongo_db.users_db)
+
+    await mongo_db.settings_catalogue.load()
+    mongo_db.settings_catalogue.start(settings.SETTINGS_POLL_INTERVAL_SECONDS)
+    await mongo_db.live_stream.load()
+    mongo_db.live_stream.start(settings.LIVE_STREAM_POLL_INTERVAL_SECONDS)
+    if mongo_db.write_queue is not None:
+        mongo_db.write_queue.start()
+
+    rollup = mongo_db.beatmap_rollup
+    rollup_sync_task = asyncio.create_task(
+        rollup.run_forever(settings.ROLLUP_SYNC_INTERVAL_SECONDS)
+    )
+    try:
+        yield
+    finally:
+        # Queued edits are flushed first, while everything they need is up.
+        if mongo_db.write_queue is not None:
+            await shutdown_step("write queue", mongo_db.write_queue.stop())
+        rollup_sync_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await rollup_sync_task
+        await shutdown_step("settings catalogue", mongo_db.settings_catalogue.stop())
+        await shutdown_step("live stream", mongo_db.live_stream.stop())
+        await shutdown_step("HTTP client", http_client.close())
+        mongo_db.close()
+        mark_process_dead()
+        log_listener.stop()
+
 
 if settings.DEBUG_MODE:
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
     origins = ["*"]
 else:
-    app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+    app = FastAPI(
+        lifespan=lifespan,
+        default_response_class=FastJSONResponse,
+        docs_url=None,
+        redoc_url=None,
+        openapi_url=None,
+    )
     origins = [
         "https://ronnia.me",
         "https://www.ronnia.me",
@@ -35,8 +112,28 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(PrometheusMiddleware)
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+)
+cache_collector = CacheCollector(
+    {
+        "top_beatmaps": top_beatmaps_cache.stats,
+        "live_users": live_users_cache.stats,
+        "jwt": token_cache.stats,
+    }
+)
+REGISTRY.register(cache_collector)
 
 app.include_router(oauth.router)
 app.include_router(user.router)
 app.include_router(live.router)
 app.include_router(requests.router)
+if settings.BOT_API_TOKEN:
+    app.include_router(bot.router)
+if settings.DEBUG_MODE or settings.METRICS_TOKEN:
+    app.include_router(metrics.router)
@@ -1,4 +1,12 @@
-from pydantic import BaseModel
+from typing import Any, List, Literal, Optional
+
+from pydantic import BaseModel, conlist, constr
+
+MAX_LOOKUP_IDS = 1000
+MAX_EXCLUSION_NAMES = 1000
+
+# Twitch logins are at most 25 characters.
+ExcludedUserName = constr(strip_whitespace=True, min_length=1, max_length=25)
 
 
 class BaseStrippedUser(BaseModel):
@@ -13,3 +21,26 @@ class StrippedOsuUser(BaseStrippedUser):
 class StrippedTwitchUser(BaseStrippedUser):
     login: str
     profile_image_url: str
+
+
+class CursorPage(BaseModel):
+    items: List[Any]
+    next_cursor: Optional[str] = None
+
+
+class ChannelLookup(BaseModel):
+    id_type: Literal["twitch", "osu"]
+    ids: conlist(int, min_items=1, max_items=MAX_LOOKUP_IDS)
+
+
+class ExcludedUserNames(BaseModel):
+    names: conlist(ExcludedUserName, min_items=1, max_items=MAX_EXCLUSION_NAMES)
+
+
+class ExclusionCheck(BaseModel):
+    channel: int
+    user: str
+
+
+class ExclusionChecks(BaseModel):
+    checks: conlist(ExclusionCheck, min_items=1, max_items=MAX_LOOKUP_IDS)
@@ -44,3 +44,24 @@ class UserResponse(BaseModel):
 
 class DBUser(UserResponse):
     settings: DBUserSettings = DBUserSettings()
+
+
+class UserSettings(BaseModel):
+    settings: DBUserSettings = DBUserSettings()
+
+
+class ExcludedUsers(BaseModel):
+    excludedUsers: List[str] = []
+
+
+class UserRevision(BaseModel):
+    version: int = 0
+    isLive: bool = False
+
+
+class BotChannel(BaseModel):
+    osuId: int
+    twitchId: int
+    twitchUsername: str
+    excludedUsers: List[str] = []
+    settings: DBUserSettings = DBUserSettings()
@@ -0,0 +1,84 @@
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.db.mongodb import AsyncMongoClient
+from app.dependencies import bearer_token_matches, get_mongo_db
+from app.models.api import ChannelLookup, ExclusionChecks
+from app.models.db import BotChannel
+from app.utils.responses import dumps
+
+router = APIRouter(prefix="/bot", tags=["bot"])
+
+LOOKUP_KEYS = {"twitch": "twitchId", "osu": "osuId"}
+
+
+def verify_bot_token(authorization: Annotated[Optional[str], Header()] = None):
+    if not bearer_token_matches(authorization, settings.BOT_API_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid bot token.")
+
+
+@router.post(
+    "/channels/lookup",
+    summary="Gets settings and excluded users of many channels at once.",
+    description="Streams one JSON object per line. Found ids have `found: true` and "
+    "the `channel`, unknown ids come last with `found: false`.",
+    dependencies=[Depends(verify_bot_token)],
+    response_class=StreamingResponse,
+)
+async def lookup_channels(
+    lookup: ChannelLookup,
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+):
+    ids = list(dict.fromkeys(lookup.ids))
+
+    async def lines():
+        missing = set(ids)
+        users = mongo_db.iter_users_by_ids(
+            LOOKUP_KEYS[lookup.id_type], ids, model=BotChannel
+        )
+        async for user_id, channel in users:
+            missing.discard(user_id)
+            yield dumps({"id": user_id, "found": True, "channel": channel}) + b"\n"
+        for user_id in ids:
+            if user_id in missing:
+                yield dumps({"id": user_id, "found": False}) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get(
+    "/channels/{twitch_id}/excluded/{user_name}",
+    summary="Checks whether a chatter is excluded on a channel.",
+    dependencies=[Depends(verify_bot_token)],
+)
+async def is_excluded(
+    twitch_id: int,
+    user_name: str,
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+):
+    excluded = await mongo_db.exclusions.is_excluded(twitch_id, user_name)
+    if excluded is None:
+        raise HTTPException(status_code=404, detail="Channel not found.")
+    return {"channel": twitch_id, "user": user_name, "excluded": excluded}
+
+
+@router.post(
+    "/exclusions/check",
+    summary="Checks many (channel, chatter) pairs at once.",
+    description="Results are in request order, `excluded` is null for channels "
+    "that are not registered.",
+    dependencies=[Depends(verify_bot_token)],
+)
+async def check_exclusions(
+    checks: ExclusionChecks,
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+):
+    pairs = [(check.channel, check.user) for check in checks.checks]
+    results = await mongo_db.exclusions.check_many(pairs)
+    return [
+        {"channel": channel, "user": user, "excluded": excluded}
+        for (channel, user), excluded in zip(pairs, results)
+    ]
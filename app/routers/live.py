@@ -1,17 +1,121 @@
+import asyncio
+import json
 import logging
-from typing import List
+from typing import List, Annotated, Optional, Union
 
-from fastapi import APIRouter
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
 from app.config import settings
 from app.db.mongodb import AsyncMongoClient
+from app.dependencies import get_mongo_db
+from app.models.api import CursorPage
+from app.utils.etag import (
+    body_etag,
+    etag_matches,
+    not_modified,
+    public_cache_control,
+    set_validators,
+)
+from app.utils.pagination import MAX_PAGE_LIMIT, decode_cursor, encode_cursor
+from app.utils.shared_cache import ttl_cache
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/live", tags=["live"])
-mongo_db = AsyncMongoClient(settings.MONGODB_URL)
+# Kept as long as clients may reuse a response anyway.
+live_users_cache = ttl_cache(
+    "live_users",
+    ttl=settings.LIVE_USERS_MAX_AGE_SECONDS,
+    max_size=settings.LIVE_USERS_CACHE_MAX_SIZE,
+    shared_directory=settings.SHARED_CACHE_DIR,
+    slot_size=settings.SHARED_CACHE_SEGMENT_SIZE,
+)
 
 
-@router.get("/users", summary="Gets currently streaming users.")
-async def get_streaming_users(limit: int = 5, offset: int = 0) -> List[str]:
-    users = await mongo_db.get_live_users(limit=limit, offset=offset)
-    return [user.twitchUsername for user in users]
+def conditional_response(request: Request, response: Response, body):
+    etag = body_etag(body)
+    cache_control = public_cache_control(settings.LIVE_USERS_MAX_AGE_SECONDS)
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    set_validators(response, etag, cache_control)
+    return body
+
+
+@router.get(
+    "/users",
+    summary="Gets currently streaming users.",
+    description="Pass `cursor` (empty for the first page) to get a page with a "
+    "`next_cursor` instead of a plain list.",
+)
+async def get_streaming_users(
+    request: Request,
+    response: Response,
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_LIMIT)] = 5,
+    offset: Annotated[int, Query(ge=0)] = 0,
+    cursor: Optional[str] = None,
+) -> Union[List[str], CursorPage]:
+    if cursor is None:
+        names, _ = await live_users_cache.get_or_set(
+            (limit, offset, None),
+            lambda: mongo_db.get_live_user_names(limit=limit, offset=offset),
+        )
+        return conditional_response(request, response, names)
+
+    after = decode_cursor(cursor)
+    try:
+        after_id = ObjectId(after["id"]) if after else None
+    except (KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    names, last_id = await live_users_cache.get_or_set(
+        (limit, 0, after_id),
+        lambda: mongo_db.get_live_user_names(limit=limit, after=after_id),
+    )
+    page = CursorPage(
+        items=names,
+        next_cursor=encode_cursor({"id": str(last_id)}) if last_id else None,
+    )
+    return conditional_response(request, response, page)
+
+
+def format_event(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+@router.get(
+    "/stream",
+    summary="Streams live user changes as server-sent events.",
+    description="Sends a `snapshot` event with every live twitch username, then "
+    "`join` and `leave` events. The stream ends when the client falls behind; "
+    "reconnecting starts over with a new snapshot.",
+    response_class=StreamingResponse,
+)
+async def stream_live_users(
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+):
+    hub = mongo_db.live_stream
+
+    async def events():
+        queue = hub.subscribe(settings.LIVE_STREAM_QUEUE_SIZE)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=settings.LIVE_STREAM_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                yield format_event(event)
+        finally:
+            hub.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
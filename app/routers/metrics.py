@@ -0,0 +1,27 @@
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from app.config import settings
+from app.dependencies import bearer_token_matches
+from app.utils.metrics import REGISTRY
+
+router = APIRouter(tags=["metrics"])
+
+
+def verify_metrics_token(authorization: Annotated[Optional[str], Header()] = None):
+    if settings.DEBUG_MODE:
+        return
+    if not bearer_token_matches(authorization, settings.METRICS_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid metrics token.")
+
+
+@router.get(
+    "/metrics",
+    summary="Prometheus metrics.",
+    include_in_schema=False,
+    dependencies=[Depends(verify_metrics_token)],
+)
+async def get_metrics():
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -1,20 +1,24 @@
 from typing import Optional, Union, Annotated
 
-from fastapi import APIRouter, Cookie
+from fastapi import APIRouter, Cookie, Depends
 from fastapi.requests import Request
 from fastapi.responses import RedirectResponse
 
-from app.config import settings
 from app.db.mongodb import AsyncMongoClient
+from app.dependencies import get_http_client, get_mongo_db
+from app.utils.http import UpstreamHTTPClient
 from app.utils.login import OsuLoginHandler, TwitchLoginHandler
 
 router = APIRouter(prefix="/oauth2", tags=["oauth2"])
-mongo_db = AsyncMongoClient(settings.MONGODB_URL)
 
 
 @router.get("/osu-login", summary="Redirects to the osu! OAuth page.")
-async def osu_oauth2_login(request: Request):
-    login_handler = OsuLoginHandler(mongo_db=mongo_db)
+async def osu_oauth2_login(
+    request: Request,
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    http_client: Annotated[UpstreamHTTPClient, Depends(get_http_client)],
+):
+    login_handler = OsuLoginHandler(mongo_db=mongo_db, http_client=http_client)
     auth_url = login_handler.generate_auth_url(state=request.headers.get("referer"))
     return RedirectResponse(url=auth_url)
 
@@ -22,10 +26,12 @@ async def osu_oauth2_login(request: Request):
 @router.get("/osu-redirect", summary="Handles OAuth redirect from osu!.")
 async def osu_oauth2_redirect(
     code: str,
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    http_client: Annotated[UpstreamHTTPClient, Depends(get_http_client)],
     state: Optional[str] = None,
     signup_details: Annotated[str, Cookie()] = None,
 ):
-    login_handler = OsuLoginHandler(mongo_db=mongo_db)
+    login_handler = OsuLoginHandler(mongo_db=mongo_db, http_client=http_client)
     login_handler.signup_cookie = signup_details
     redirect_response = await redirect_route(
         code=code, state=state, login_handler=login_handler
@@ -34,8 +40,12 @@ async def osu_oauth2_redirect(
 
 
 @router.get("/twitch-login", summary="Redirects to the Twitch OAuth page.")
-async def osu_oauth2_login(request: Request):
-    login_handler = TwitchLoginHandler(mongo_db=mongo_db)
+async def osu_oauth2_login(
+    request: Request,
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    http_client: Annotated[UpstreamHTTPClient, Depends(get_http_client)],
+):
+    login_handler = TwitchLoginHandler(mongo_db=mongo_db, http_client=http_client)
     auth_url = login_handler.generate_auth_url(state=request.headers.get("referer"))
     return RedirectResponse(url=auth_url)
 
@@ -43,10 +53,12 @@ async def osu_oauth2_login(request: Request):
 @router.get("/twitch-redirect", summary="Handles OAuth redirect from Twitch.")
 async def osu_oauth2_redirect(
     code: str,
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    http_client: Annotated[UpstreamHTTPClient, Depends(get_http_client)],
     state: Optional[str] = None,
     signup_details: Annotated[str, Cookie()] = None,
 ):
-    login_handler = TwitchLoginHandler(mongo_db=mongo_db)
+    login_handler = TwitchLoginHandler(mongo_db=mongo_db, http_client=http_client)
     login_handler.signup_cookie = signup_details
     redirect_response = await redirect_route(
         code=code, state=state, login_handler=login_handler
@@ -1,37 +1,135 @@
 import datetime
+from typing import Annotated, Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 
 from app.config import settings
 from app.db.mongodb import AsyncMongoClient
+from app.dependencies import get_mongo_db
+from app.utils.etag import (
+    bytes_etag,
+    etag_matches,
+    make_etag,
+    not_modified,
+    public_cache_control,
+    set_validators,
+)
+from app.utils.pagination import MAX_PAGE_LIMIT, decode_cursor, encode_cursor
+from app.utils.responses import EncodedJSONResponse, dumps
+from app.utils.shared_cache import ttl_cache
 
 router = APIRouter(prefix="/requests", tags=["requests"])
-mongo_db = AsyncMongoClient(settings.MONGODB_URL)
+top_beatmaps_cache = ttl_cache(
+    "top_beatmaps",
+    ttl=settings.TOP_BEATMAPS_CACHE_TTL_SECONDS,
+    max_size=settings.TOP_BEATMAPS_CACHE_MAX_SIZE,
+    shared_directory=settings.SHARED_CACHE_DIR,
+    slot_size=settings.SHARED_CACHE_SEGMENT_SIZE,
+)
+PAGINATION_DESCRIPTION = (
+    "Pass `cursor` (empty for the first page) to get a page with a `next_cursor` "
+    "instead of a plain list."
+)
+
 
+class TopBeatmapsParams:
+    def __init__(
+        self,
+        limit: Annotated[int, Query(ge=1, le=MAX_PAGE_LIMIT)] = 5,
+        offset: Annotated[int, Query(ge=0)] = 0,
+        cursor: Optional[str] = None,
+    ):
+        self.limit = limit
+        self.offset = offset
+        self.cursor = cursor
 
-@router.get("/beatmaps/top/daily", summary="Shows top requested beatmaps for today.")
-async def top_beatmap_requests_day(limit: int = 5, offset: int = 0):
-    time_start = datetime.datetime.today() - datetime.timedelta(days=1)
-    return await mongo_db.get_top_requested_beatmaps(
-        time_start=time_start, limit=limit, offset=offset
+
+async def get_top_beatmaps(
+    request: Request,
+    mongo_db: AsyncMongoClient,
+    window: datetime.timedelta,
+    params: TopBeatmapsParams,
+):
+    after = decode_cursor(params.cursor)
+    try:
+        after_key = (int(after["count"]), int(after["id"])) if after else None
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    offset = 0 if params.cursor is not None else params.offset
+
+    async def query():
+        time_start = datetime.datetime.utcnow() - window
+        beatmaps = await mongo_db.beatmap_rollup.get_top_requested_beatmaps(
+            time_start=time_start, limit=params.limit, offset=offset, after=after_key
+        )
+        # Encoded and fingerprinted once per cache fill, so cache hits skip
+        # serialization and revalidation is a cache lookup.
+        encoded = dumps(beatmaps)
+        return bytes_etag(encoded), beatmaps, encoded
+
+    beatmaps_etag, beatmaps, encoded = await top_beatmaps_cache.get_or_set(
+        (window, params.limit, offset, after_key), query
     )
+    etag = make_etag(beatmaps_etag, params.cursor is None)
+    cache_control = public_cache_control(settings.TOP_BEATMAPS_CACHE_TTL_SECONDS)
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+
+    if params.cursor is not None:
+        next_cursor = None
+        if len(beatmaps) == params.limit:
+            last = beatmaps[-1]
+            next_cursor = encode_cursor({"count": last["count"], "id": last["_id"]})
+        # Same shape as CursorPage, spliced around the cached items.
+        encoded = b'{"items":%s,"next_cursor":%s}' % (encoded, dumps(next_cursor))
+    response = EncodedJSONResponse(encoded)
+    set_validators(response, etag, cache_control)
+    return response
 
 
 @router.get(
-    "/beatmaps/top/weekly", summary="Shows top requested beatmaps for this week."
+    "/beatmaps/top/daily",
+    summary="Shows top requested beatmaps for today.",
+    description=PAGINATION_DESCRIPTION,
 )
-async def top_beatmap_requests_week(limit: int = 5, offset: int = 0):
-    time_start = datetime.datetime.today() - datetime.timedelta(days=30)
-    return await mongo_db.get_top_requested_beatmaps(
-        time_start=time_start, limit=limit, offset=offset
-    )
+async def top_beatmap_requests_day(
+    request: Request,
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    params: Annotated[TopBeatmapsParams, Depends()],
+):
+    return await get_top_beatmaps(request, mongo_db, datetime.timedelta(days=1), params)
+
+
+@router.get(
+    "/beatmaps/top/weekly",
+    summary="Shows top requested beatmaps for this week.",
+    description=PAGINATION_DESCRIPTION,
+)
+async def top_beatmap_requests_week(
+    request: Request,
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    params: Annotated[TopBeatmapsParams, Depends()],
+):
+    return await get_top_beatmaps(request, mongo_db, datetime.timedelta(days=7), params)
 
 
 @router.get(
-    "/beatmaps/top/monthly", summary="Shows top requested beatmaps for this month."
+    "/beatmaps/top/monthly",
+    summary="Shows top requested beatmaps for this month.",
+    description=PAGINATION_DESCRIPTION,
 )
-async def top_beatmap_requests_month(limit: int = 5, offset: int = 0):
-    time_start = datetime.datetime.today() - datetime.timedelta(days=30)
-    return await mongo_db.get_top_requested_beatmaps(
-        time_start=time_start, limit=limit, offset=offset
+async def top_beatmap_requests_month(
+    request: Request,
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    params: Annotated[TopBeatmapsParams, Depends()],
+):
+    return await get_top_beatmaps(
+        request, mongo_db, datetime.timedelta(days=30), params
     )
+
+
+if settings.DEBUG_MODE:
+
+    @router.get("/beatmaps/top/cache", summary="Shows top beatmaps cache counters.")
+    async def top_beatmaps_cache_stats():
+        return top_beatmaps_cache.stats()
@@ -1,18 +1,31 @@
 import logging
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Cookie
+from fastapi import APIRouter, Depends, Cookie, HTTPException, Response
 from fastapi.requests import Request
 from fastapi.responses import RedirectResponse
 
-from app.config import settings
 from app.db.mongodb import AsyncMongoClient
-from app.models.db import DBUserSettings, UserResponse
-from app.utils.jwt import decode_jwt
+from app.dependencies import get_mongo_db
+from app.models.api import ExcludedUserNames
+from app.models.db import (
+    DBUserSettings,
+    ExcludedUsers,
+    UserResponse,
+    UserRevision,
+    UserSettings,
+)
+from app.utils.etag import (
+    PRIVATE_CACHE_CONTROL,
+    etag_matches,
+    make_etag,
+    not_modified,
+    set_validators,
+)
+from app.utils.jwt import decode_jwt, revoke_jwt
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/user", tags=["user"])
-mongo_db = AsyncMongoClient(settings.MONGODB_URL)
 
 
 def decode_user_token(
@@ -21,20 +34,53 @@ def decode_user_token(
     return decode_jwt(token)
 
 
+def user_etag(
+    mongo_db: AsyncMongoClient,
+    route: str,
+    osu_id: int,
+    revision: UserRevision,
+    *parts,
+) -> str:
+    # The revision comes from the same document as the body. Queued writes
+    # are not in its version yet but already overlaid on the body.
+    pending = mongo_db.pending_write_sequence(osu_id)
+    return make_etag(route, osu_id, revision.version, revision.isLive, pending, *parts)
+
+
+async def user_with_revision(mongo_db: AsyncMongoClient, osu_id: int, model):
+    found = await mongo_db.get_user_with_revision(osu_id, model)
+    if found is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return found
+
+
 @router.get("/me", summary="Gets registered user details from database")
 async def get_user_details(
-    token: Annotated[str, Cookie()] = None, signup: Annotated[str, Cookie()] = None
+    request: Request,
+    response: Response,
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    token: Annotated[str, Cookie()] = None,
+    signup: Annotated[str, Cookie()] = None,
 ):
     if signup:
         return {"signup": signup}
     if token:
         user = decode_jwt(token)
-        db_user = await mongo_db.get_user_from_osu_id(user["osuId"])
-        return UserResponse(**db_user.dict())
+        found = await mongo_db.get_user_with_revision(user["osuId"], UserResponse)
+        if found is None:
+            return None
+        details, revision = found
+        etag = user_etag(mongo_db, "me", user["osuId"], revision)
+        if etag_matches(request, etag):
+            return not_modified(etag, PRIVATE_CACHE_CONTROL)
+        set_validators(response, etag, PRIVATE_CACHE_CONTROL)
+        return details
 
 
 @router.get("/logout", summary="Logout from the website")
-async def remove_user(request: Request):
+async def remove_user(request: Request, token: Annotated[str, Cookie()] = None):
+    if token:
+        revoke_jwt(token)
     response = RedirectResponse(url=request.headers.get("referer"))
     response.set_cookie("token", expires=0, max_age=0)
     return response
@@ -42,35 +88,73 @@ async def remove_user(request: Request):
 
 @router.delete("/me", summary="Deletes the registered user from database")
 async def remove_user(
-    user: Annotated[dict, Depends(decode_user_token)], request: Request
+    user: Annotated[dict, Depends(decode_user_token)],
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    request: Request,
+    token: Annotated[str, Cookie()],
 ):
     await mongo_db.remove_user_by_twitch_id(user["twitchId"])
+    revoke_jwt(token)
     response = RedirectResponse(url=request.headers.get("referer"))
     response.set_cookie("token", expires=0, max_age=0)
     return response
 
 
 @router.get("/settings", summary="Gets user settings from database")
-async def get_settings(user: Annotated[dict, Depends(decode_user_token)]):
-    return await mongo_db.get_user_settings(user["osuId"])
+async def get_settings(
+    request: Request,
+    response: Response,
+    user: Annotated[dict, Depends(decode_user_token)],
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+):
+    await mongo_db.settings_catalogue.get()
+    user_settings, revision = await user_with_revision(
+        mongo_db, user["osuId"], UserSettings
+    )
+    etag = user_etag(
+        mongo_db,
+        "settings",
+        user["osuId"],
+        revision,
+        mongo_db.settings_catalogue.fingerprint,
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag, PRIVATE_CACHE_CONTROL)
+    set_validators(response, etag, PRIVATE_CACHE_CONTROL)
+    return await mongo_db.apply_user_settings(user_settings)
 
 
 @router.post("/settings", summary="Post user settings to database")
 async def post_settings(
-    user: Annotated[dict, Depends(decode_user_token)], user_settings: DBUserSettings
+    user: Annotated[dict, Depends(decode_user_token)],
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    user_settings: DBUserSettings,
 ):
     await mongo_db.update_user_settings(user["osuId"], user_settings)
 
 
 @router.get("/exclude", summary="Get a user's excluded users list")
-async def get_excluded_users(user: Annotated[dict, Depends(decode_user_token)]):
-    excluded_list = await mongo_db.get_excluded_users(user["osuId"])
-    return excluded_list
+async def get_excluded_users(
+    request: Request,
+    response: Response,
+    user: Annotated[dict, Depends(decode_user_token)],
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+):
+    excluded, revision = await user_with_revision(
+        mongo_db, user["osuId"], ExcludedUsers
+    )
+    etag = user_etag(mongo_db, "exclude", user["osuId"], revision)
+    if etag_matches(request, etag):
+        return not_modified(etag, PRIVATE_CACHE_CONTROL)
+    set_validators(response, etag, PRIVATE_CACHE_CONTROL)
+    return excluded.excludedUsers
 
 
 @router.post("/exclude", summary="Adds an excluded user to user's list")
 async def add_excluded_user(
-    user: Annotated[dict, Depends(decode_user_token)], excluded_user: str
+    user: Annotated[dict, Depends(decode_user_token)],
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    excluded_user: str,
 ):
     await mongo_db.add_excluded_user(user["osuId"], excluded_user)
     return excluded_user
@@ -78,7 +162,29 @@ async def add_excluded_user(
 
 @router.delete("/exclude", summary="Adds an excluded user to user's list")
 async def remove_excluded_user(
-    user: Annotated[dict, Depends(decode_user_token)], excluded_user: str
+    user: Annotated[dict, Depends(decode_user_token)],
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    excluded_user: str,
 ):
     await mongo_db.remove_excluded_user(user["osuId"], excluded_user)
     return excluded_user
+
+
+@router.post("/exclude/bulk", summary="Adds many excluded users to user's list")
+async def add_excluded_users(
+    user: Annotated[dict, Depends(decode_user_token)],
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    excluded_users: ExcludedUserNames,
+):
+    await mongo_db.add_excluded_users(user["osuId"], excluded_users.names)
+    return excluded_users.names
+
+
+@router.delete("/exclude/bulk", summary="Removes many excluded users from user's list")
+async def remove_excluded_users(
+    user: Annotated[dict, Depends(decode_user_token)],
+    mongo_db: Annotated[AsyncMongoClient, Depends(get_mongo_db)],
+    excluded_users: ExcludedUserNames,
+):
+    await mongo_db.remove_excluded_users(user["osuId"], excluded_users.names)
+    return excluded_users.names
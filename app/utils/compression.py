@@ -0,0 +1,172 @@
+import zlib
+from typing import List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # Optional, responses fall back to gzip without it.
+    brotli = None
+
+# Streams that have to reach the client as they are written.
+UNBUFFERED_MEDIA_TYPES = ("text/event-stream",)
+
+
+def parse_accept_encoding(header: str) -> List[Tuple[str, float]]:
+    codings = []
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            codings.append((coding.strip().lower(), quality))
+    return codings
+
+
+def choose_encoding(header: str, available: List[str]) -> Optional[str]:
+    """Picks the best coding the client accepts, ties go to ``available`` order."""
+    qualities = dict(parse_accept_encoding(header))
+    wildcard = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in available:
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        # wbits 31 writes a gzip header and trailer around the deflate stream.
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """Compresses responses with brotli or gzip, whichever the client prefers.
+
+    Bodies under ``minimum_size`` and event streams are sent as they are.
+    Streamed bodies are compressed chunk by chunk without being buffered.
+    Every response it could have encoded, 304s and small bodies included,
+    carries ``Vary: Accept-Encoding``, and a weak ETag whenever an encoding
+    was negotiated, so a 304 always repeats the validators of its 200.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1000,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.available = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+    def compressor(self, encoding: str):
+        if encoding == "br":
+            return BrotliCompressor(self.brotli_quality)
+        return GzipCompressor(self.gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+            encoding = choose_encoding(accept_encoding, self.available)
+            responder = CompressionResponder(self, encoding, send)
+            await self.app(scope, receive, responder.send)
+            return
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    def __init__(
+        self, middleware: CompressionMiddleware, encoding: Optional[str], send: Send
+    ):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.initial_message: Optional[Message] = None
+        self.compressor = None
+        self.passthrough = False
+
+    def _mark_negotiated(self):
+        """Sets the headers shared by every response this one could be."""
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        # The encoded bytes differ from the identity body the ETag was made
+        # for, and the 304 can't know whether its 200 would be encoded.
+        etag = headers.get("etag")
+        if self.encoding is not None and etag is not None and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+
+    def _start_compressing(self):
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        if "content-length" in headers:
+            del headers["Content-Length"]
+        self.compressor = self.middleware.compressor(self.encoding)
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "")
+            self.passthrough = "content-encoding" in headers or media_type.startswith(
+                UNBUFFERED_MEDIA_TYPES
+            )
+            if not self.passthrough:
+                self._mark_negotiated()
+                self.passthrough = self.encoding is None
+            if self.passthrough:
+                await self._send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+                await self._send(self.initial_message)
+                await self._send(message)
+                return
+            self._start_compressing()
+            if not more_body:
+                body = self.compressor.compress(body) + self.compressor.finish()
+                headers = MutableHeaders(raw=self.initial_message["headers"])
+                headers["Content-Length"] = str(len(body))
+                await self._send(self.initial_message)
+                await self._send({**message, "body": body})
+                return
+            await self._send(self.initial_message)
+
+        chunk = self.compressor.compress(body)
+        if not more_body:
+            chunk += self.compressor.finish()
+        await self._send({**message, "body": chunk})
@@ -0,0 +1,46 @@
+import hashlib
+from typing import Any
+
+from fastapi import Request, Response
+
+from app.utils.responses import dumps
+
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def bytes_etag(data: bytes) -> str:
+    return f'"{hashlib.blake2b(data, digest_size=12).hexdigest()}"'
+
+
+def body_etag(body: Any) -> str:
+    """Fingerprints a response body for data that carries no version of its own."""
+    return bytes_etag(dumps(body))
+
+
+def public_cache_control(max_age: float) -> str:
+    return f"public, max-age={int(max_age)}"
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def set_validators(response: Response, etag: str, cache_control: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": cache_control}
+    )
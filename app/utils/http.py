@@ -0,0 +1,106 @@
+import time
+from typing import Any, Dict, Optional, TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from app.utils.metrics import UPSTREAM_LATENCY
+
+if TYPE_CHECKING:
+    import aiohttp
+
+    from app.config import HTTPClientSettings
+
+
+class UpstreamLatency:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float, failed: bool):
+        self.count += 1
+        self.errors += failed
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": self.total_seconds / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max_seconds * 1000,
+        }
+
+
+class UpstreamHTTPClient:
+    """One keep-alive connection pool for every osu! and Twitch API call.
+
+    aiohttp is only imported when the pool is started, which happens on the
+    first call unless ``start`` was awaited before.
+    """
+
+    def __init__(
+        self,
+        limit_per_host: int = 20,
+        dns_cache_ttl: int = 300,
+        keepalive_timeout: float = 30,
+        connect_timeout: float = 5,
+        read_timeout: float = 10,
+    ):
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.latencies: Dict[str, UpstreamLatency] = {}
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    @classmethod
+    def from_settings(cls, settings: "HTTPClientSettings") -> "UpstreamHTTPClient":
+        return cls(
+            limit_per_host=settings.HTTP_LIMIT_PER_HOST,
+            dns_cache_ttl=settings.HTTP_DNS_CACHE_TTL_SECONDS,
+            keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT_SECONDS,
+            connect_timeout=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+            read_timeout=settings.HTTP_READ_TIMEOUT_SECONDS,
+        )
+
+    async def start(self):
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self.connect_timeout, sock_read=self.read_timeout
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request_json(self, method: str, url: str, **kwargs) -> Any:
+        if self._session is None:
+            await self.start()
+        host = urlsplit(url).netloc
+        started = time.perf_counter()
+        failed = True
+        status = "error"
+        try:
+            async with self._session.request(method, url, **kwargs) as response:
+                status = str(response.status)
+                body = await response.json()
+                failed = response.status >= 500
+                return body
+        finally:
+            elapsed = time.perf_counter() - started
+            latency = self.latencies.setdefault(host, UpstreamLatency())
+            latency.record(elapsed, failed)
+            UPSTREAM_LATENCY.labels(host, status).observe(elapsed)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {host: latency.dict() for host, latency in self.latencies.items()}
@@ -1,5 +1,8 @@
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 from jose import jwt
 
@@ -10,6 +13,67 @@ SECRET_KEY = settings.JWT_SECRET_KEY
 ALGORITHM = settings.JWT_ALGORITHM
 
 
+class VerifiedTokenCache:
+    """LRU cache of token payloads whose signature was already verified.
+
+    Entries are keyed by a digest of the token and expire at the token's own
+    ``exp`` claim, or after ``max_age`` seconds, whichever comes first.
+    """
+
+    def __init__(self, max_size: int, max_age: float):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._entries: "OrderedDict[bytes, Tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, payload = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(payload)
+
+    def put(self, token: str, payload: dict):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.max_age
+        if "exp" in payload:
+            expires_at = min(expires_at, float(payload["exp"]))
+        key = self._key(token)
+        self._entries[key] = (expires_at, dict(payload))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def evict(self, token: str):
+        self._entries.pop(self._key(token), None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+token_cache = VerifiedTokenCache(
+    max_size=settings.JWT_CACHE_MAX_SIZE,
+    max_age=settings.JWT_CACHE_MAX_AGE_SECONDS,
+)
+
+
 def obtain_jwt(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -22,5 +86,13 @@ def obtain_jwt(data: dict, expires_delta: Optional[timedelta] = None):
 
 
 def decode_jwt(jwt_token: str):
+    user_data_dict = token_cache.get(jwt_token)
+    if user_data_dict is not None:
+        return user_data_dict
     user_data_dict = jwt.decode(jwt_token, key=SECRET_KEY, algorithms=ALGORITHM)
+    token_cache.put(jwt_token, user_data_dict)
     return user_data_dict
+
+
+def revoke_jwt(jwt_token: str):
+    token_cache.evict(jwt_token)
@@ -1,7 +1,6 @@
 from abc import ABC
 from typing import Optional, Dict, Any, Union
 
-import aiohttp
 from fastapi.encoders import jsonable_encoder
 from jose import jwt
 
@@ -13,6 +12,7 @@ from app.models.oauth import (
     TwitchOauthAuthorizationCodeTokenResponse,
     OsuOauthAuthorizationCodeTokenResponse,
 )
+from app.utils.http import UpstreamHTTPClient
 from app.utils.jwt import obtain_jwt
 from app.utils.oauth import OsuOAuthHandler, TwitchOauthHandler
 
@@ -21,8 +21,10 @@ class BaseLoginHandler:
     def __init__(
         self,
         mongo_db: Optional[AsyncMongoClient] = None,
+        http_client: Optional[UpstreamHTTPClient] = None,
     ):
         self._mongo_client: AsyncMongoClient = mongo_db
+        self._http_client: UpstreamHTTPClient = http_client
         self._api_field_mapping = {}
         self._auth_header = {}
         self._access_token = None
@@ -38,9 +40,9 @@ class BaseLoginHandler:
 
     async def _get_user_from_token(self, access_token: str) -> Dict[str, Any]:
         self._auth_header["Authorization"] = f"Bearer {access_token}"
-        async with aiohttp.ClientSession(headers=self._auth_header) as session:
-            async with session.get(self.me_url) as response:
-                return await response.json()
+        return await self._http_client.request_json(
+            "GET", self.me_url, headers=self._auth_header
+        )
 
     async def _get_user_from_db(self, me_response: Dict[str, Any]):
         raise NotImplementedError
@@ -73,13 +75,14 @@ class BaseLoginHandler:
 
 
 class OsuLoginHandler(BaseLoginHandler):
-    def __init__(self, mongo_db: AsyncMongoClient):
-        super().__init__(mongo_db=mongo_db)
-        self.me_url = "https://osu.ppy.sh/api/v2/me"
+    def __init__(self, mongo_db: AsyncMongoClient, http_client: UpstreamHTTPClient):
+        super().__init__(mongo_db=mongo_db, http_client=http_client)
+        self.me_url = f"{settings.OSU_BASE_URL}/api/v2/me"
         self._oauth_handler = OsuOAuthHandler(
             settings.OSU_CLIENT_ID,
             settings.OSU_CLIENT_SECRET,
             settings.OSU_REDIRECT_URI,
+            http_client,
             scopes=["identify"],
         )
         self.api_user: StrippedOsuUser
@@ -106,13 +109,14 @@ class OsuLoginHandler(BaseLoginHandler):
 
 
 class TwitchLoginHandler(BaseLoginHandler, ABC):
-    def __init__(self, mongo_db: AsyncMongoClient):
-        super().__init__(mongo_db=mongo_db)
-        self.me_url = "https://api.twitch.tv/helix/users"
+    def __init__(self, mongo_db: AsyncMongoClient, http_client: UpstreamHTTPClient):
+        super().__init__(mongo_db=mongo_db, http_client=http_client)
+        self.me_url = f"{settings.TWITCH_API_BASE_URL}/helix/users"
         self._oauth_handler = TwitchOauthHandler(
             settings.TWITCH_CLIENT_ID,
             settings.TWITCH_CLIENT_SECRET,
             settings.TWITCH_REDIRECT_URI,
+            http_client,
             scopes=["user:read:email"],
         )
         self.api_user: StrippedTwitchUser
@@ -0,0 +1,158 @@
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+from pydantic import BaseModel
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+if TYPE_CHECKING:
+    from app.config import CommonSettings
+
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+REQUEST_ID_HEADER = "x-request-id"
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class RequestIdMiddleware:
+    """Tags every log record of a request with the caller's or a new request id."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        value = headers.get(REQUEST_ID_HEADER.encode(), b"").decode("latin-1")
+        value = value[:64] or uuid.uuid4().hex
+        token = request_id.set(value)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"].append((REQUEST_ID_HEADER.encode(), value.encode()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id.reset(token)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a share of DEBUG and INFO records of chosen loggers.
+
+    Rates apply to a logger and its children, the most specific name wins.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.rate_for = lru_cache(maxsize=None)(self._rate_for)
+
+    def _rate_for(self, name: str) -> float:
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+def redact(value: Any) -> Any:
+    if isinstance(value, dict):
+        return f"<document with {len(value)} fields>"
+    if isinstance(value, BaseModel):
+        return f"<{type(value).__name__}>"
+    if isinstance(value, (list, tuple)) and value and isinstance(value[0], dict):
+        return f"<{len(value)} documents>"
+    return value
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to a ``QueueListener`` thread without formatting them.
+
+    Only the request id is captured and document bodies are redacted on the
+    calling thread; message formatting and I/O happen on the listener thread.
+    Records are dropped rather than blocking when the queue is full.
+    """
+
+    def __init__(self, log_queue: queue.Queue, redact_documents: bool = True):
+        super().__init__(log_queue)
+        self.redact_documents = redact_documents
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.request_id = request_id.get()
+        if self.redact_documents and record.args:
+            if isinstance(record.args, dict) and "%(" in str(record.msg):
+                record.args = {k: redact(v) for k, v in record.args.items()}
+            elif isinstance(record.args, dict):
+                # A lone mapping argument is unwrapped by ``LogRecord``.
+                record.args = (redact(record.args),)
+            else:
+                record.args = tuple(redact(arg) for arg in record.args)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(settings: "CommonSettings") -> QueueListener:
+    """Routes the root logger through a queue; start the returned listener."""
+    if settings.LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+        )
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(
+        log_queue, redact_documents=not settings.LOG_DOCUMENTS
+    )
+    handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.LOG_LEVEL)
+    return QueueListener(log_queue, output, respect_handler_level=True)
@@ -0,0 +1,269 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import prometheus_client
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from pymongo import monitoring
+from starlette.routing import BaseRoute, Match, Route
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Set for multi-worker servers: every worker writes its samples to files in
+# this directory and a scrape of any worker merges them.
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+if MULTIPROCESS:
+    REGISTRY = CollectorRegistry()
+    multiprocess.MultiProcessCollector(REGISTRY)
+else:
+    REGISTRY = prometheus_client.REGISTRY
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request.",
+    ["method", "route", "status"],
+)
+STREAM_DURATION = Histogram(
+    "http_stream_duration_seconds",
+    "Time event streams stayed open.",
+    ["route"],
+    buckets=(1, 10, 30, 60, 300, 900, 1800, 3600, 3 * 3600, 12 * 3600),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled.",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongodb_command_duration_seconds",
+    "Time MongoDB took to answer a command.",
+    ["command", "collection"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongodb_command_failures_total",
+    "MongoDB commands that returned an error.",
+    ["command", "collection"],
+)
+MONGO_CHECKOUT_WAIT = Histogram(
+    "mongodb_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled MongoDB connection.",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+MONGO_CHECKOUT_FAILURES = Counter(
+    "mongodb_pool_checkout_failures_total",
+    "Connection checkouts that failed or timed out.",
+    ["reason"],
+)
+MONGO_CONNECTIONS_IN_USE = Gauge(
+    "mongodb_pool_connections_in_use",
+    "Pooled MongoDB connections currently checked out.",
+    multiprocess_mode="livesum",
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds",
+    "Time spent on osu! and Twitch API calls.",
+    ["host", "status"],
+)
+
+UNMATCHED_ROUTE = "unmatched"
+EVENT_STREAM = b"text/event-stream"
+
+
+class RouteLabels:
+    """Finds route templates by method and path.
+
+    Routes without path parameters are looked up in a dict, only the others
+    are matched one by one.
+    """
+
+    def __init__(self, routes: List[BaseRoute]):
+        self.routes = routes
+        self.route_count = len(routes)
+        self.static: Dict[Tuple[Optional[str], str], str] = {}
+        self.dynamic: List[BaseRoute] = []
+        for route in routes:
+            if isinstance(route, Route) and not route.param_convertors:
+                for method in route.methods or [None]:
+                    self.static.setdefault((method, route.path), route.path)
+            else:
+                self.dynamic.append(route)
+
+    def __call__(self, scope: Scope) -> str:
+        path = scope["path"]
+        label = self.static.get((scope["method"], path)) or self.static.get(
+            (None, path)
+        )
+        if label is not None:
+            return label
+        for route in self.dynamic:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return UNMATCHED_ROUTE
+
+
+# Keyed by the id of the routes list, which the RouteLabels keeps alive.
+_route_labels: Dict[int, RouteLabels] = {}
+
+
+def route_label(scope: Scope) -> str:
+    """Labels a request by its route template so ids don't explode cardinality."""
+    routes = scope["app"].router.routes
+    labels = _route_labels.get(id(routes))
+    if labels is None or labels.route_count != len(routes):
+        labels = _route_labels[id(routes)] = RouteLabels(routes)
+    return labels(scope)
+
+
+def mark_process_dead():
+    """Drops this worker's live gauges from the multiprocess files on exit."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class PrometheusMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_label(scope)
+        status = 500
+        streaming = False
+
+        async def send_wrapper(message: Message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = any(
+                    name == b"content-type" and value.startswith(EVENT_STREAM)
+                    for name, value in message["headers"]
+                )
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            elapsed = time.perf_counter() - started
+            # Streams stay open for minutes and would swamp the latency buckets.
+            if streaming:
+                STREAM_DURATION.labels(route).observe(elapsed)
+            else:
+                REQUEST_LATENCY.labels(method, route, str(status)).observe(elapsed)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self._collections: Dict[Tuple[object, int], str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _collection(self, event) -> str:
+        return self._collections.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        MONGO_COMMAND_LATENCY.labels(
+            event.command_name, self._collection(event)
+        ).observe(event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        collection = self._collection(event)
+        MONGO_COMMAND_LATENCY.labels(event.command_name, collection).observe(
+            event.duration_micros / 1e6
+        )
+        MONGO_COMMAND_FAILURES.labels(event.command_name, collection).inc()
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Measures checkout waits.
+
+    PyMongo checks a connection out synchronously on the thread running the
+    operation, so the start time is kept in a thread local.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            MONGO_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+            self._local.started = None
+        MONGO_CONNECTIONS_IN_USE.inc()
+
+    def connection_check_out_failed(self, event):
+        self._local.started = None
+        MONGO_CHECKOUT_FAILURES.labels(event.reason).inc()
+
+    def connection_checked_in(self, event):
+        MONGO_CONNECTIONS_IN_USE.dec()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+
+class CacheCollector:
+    """Exports hit/miss counters of in-process caches when scraped.
+
+    In multiprocess mode only the worker answering the scrape is reported, so
+    its series carry a ``pid`` label.
+    """
+
+    def __init__(self, caches: Dict[str, Callable[[], Dict[str, int]]]):
+        self.caches = caches
+
+    def collect(self):
+        labels = ["cache", "pid"] if MULTIPROCESS else ["cache"]
+        extra = [str(os.getpid())] if MULTIPROCESS else []
+        hits = CounterMetricFamily("cache_hits", "Cache hits.", labels=labels)
+        misses = CounterMetricFamily("cache_misses", "Cache misses.", labels=labels)
+        ratio = GaugeMetricFamily(
+            "cache_hit_ratio", "Hits over lookups since start.", labels=labels
+        )
+        size = GaugeMetricFamily("cache_size", "Cached entries.", labels=labels)
+        for name, stats in self.caches.items():
+            values = stats()
+            lookups = values["hits"] + values["misses"]
+            hits.add_metric([name, *extra], values["hits"])
+            misses.add_metric([name, *extra], values["misses"])
+            ratio.add_metric(
+                [name, *extra], values["hits"] / lookups if lookups else 0.0
+            )
+            size.add_metric([name, *extra], values["size"])
+        yield from (hits, misses, ratio, size)
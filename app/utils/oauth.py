@@ -1,12 +1,12 @@
 from abc import ABC
 from typing import List, Dict, Any
 
-import aiohttp
-
+from app.config import settings
 from app.models.oauth import (
     OsuOauthAuthorizationCodeTokenResponse,
     TwitchOauthAuthorizationCodeTokenResponse,
 )
+from app.utils.http import UpstreamHTTPClient
 
 
 class BaseOAuthHandler:
@@ -15,8 +15,10 @@ class BaseOAuthHandler:
         client_id: str,
         client_secret: str,
         redirect_uri: str,
+        http_client: UpstreamHTTPClient,
         scopes: List[str] = None,
     ):
+        self.http_client = http_client
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
@@ -36,18 +38,17 @@ class BaseOAuthHandler:
         )
 
     async def get_oauth_token(self, code: str) -> Dict[str, Any]:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                self.token_url,
-                json={
-                    "client_id": self.client_id,
-                    "client_secret": self.client_secret,
-                    "code": code,
-                    "grant_type": "authorization_code",
-                    "redirect_uri": self.redirect_uri,
-                },
-            ) as response:
-                return await response.json()
+        return await self.http_client.request_json(
+            "POST",
+            self.token_url,
+            json={
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "code": code,
+                "grant_type": "authorization_code",
+                "redirect_uri": self.redirect_uri,
+            },
+        )
 
 
 class OsuOAuthHandler(BaseOAuthHandler, ABC):
@@ -56,11 +57,12 @@ class OsuOAuthHandler(BaseOAuthHandler, ABC):
         client_id: str,
         client_secret: str,
         redirect_uri: str,
+        http_client: UpstreamHTTPClient,
         scopes: List[str] = None,
     ):
-        super().__init__(client_id, client_secret, redirect_uri, scopes)
-        self.auth_url = "https://osu.ppy.sh/oauth/authorize"
-        self.token_url = "https://osu.ppy.sh/oauth/token"
+        super().__init__(client_id, client_secret, redirect_uri, http_client, scopes)
+        self.auth_url = f"{settings.OSU_BASE_URL}/oauth/authorize"
+        self.token_url = f"{settings.OSU_BASE_URL}/oauth/token"
 
     async def get_oauth_token(
         self, code: str
@@ -75,11 +77,12 @@ class TwitchOauthHandler(BaseOAuthHandler, ABC):
         client_id: str,
         client_secret: str,
         redirect_uri: str,
+        http_client: UpstreamHTTPClient,
         scopes: List[str] = None,
     ):
-        super().__init__(client_id, client_secret, redirect_uri, scopes)
-        self.auth_url = "https://id.twitch.tv/oauth2/authorize"
-        self.token_url = "https://id.twitch.tv/oauth2/token"
+        super().__init__(client_id, client_secret, redirect_uri, http_client, scopes)
+        self.auth_url = f"{settings.TWITCH_ID_BASE_URL}/oauth2/authorize"
+        self.token_url = f"{settings.TWITCH_ID_BASE_URL}/oauth2/token"
 
     async def get_oauth_token(
         self, code: str
@@ -0,0 +1,25 @@
+import base64
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+
+MAX_PAGE_LIMIT = 100
+
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    payload = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not cursor:
+        return None
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if not isinstance(values, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return values
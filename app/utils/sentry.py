@@ -0,0 +1,153 @@
+import datetime
+import random
+import time
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+from app.utils.metrics import route_label
+
+if TYPE_CHECKING:
+    from app.config import CommonSettings
+
+# Span statuses Sentry derives from 5xx responses and unhandled exceptions.
+SERVER_ERROR_STATUSES = {
+    "internal_error",
+    "unknown_error",
+    "unavailable",
+    "deadline_exceeded",
+    "data_loss",
+    "unimplemented",
+}
+
+
+class TransactionBudget:
+    """Caps kept transactions per second and learns a scale for sampling rates.
+
+    Every second the scale is lowered by the factor the transactions asking to
+    be kept overshot the budget by, and doubled back up to ``1`` once they fall
+    under half the budget.
+    """
+
+    def __init__(self, max_per_second: float):
+        self.max_per_second = max_per_second
+        self.scale = 1.0
+        self._window_start = time.monotonic()
+        self._offered = 0
+        self._kept = 0
+
+    def _roll_window(self):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < 1:
+            return
+        rate = self._offered / elapsed
+        if rate > self.max_per_second:
+            self.scale *= self.max_per_second / rate
+        elif rate < self.max_per_second / 2:
+            self.scale = min(1.0, self.scale * 2)
+        self._window_start = now
+        self._offered = 0
+        self._kept = 0
+
+    def acquire(self, force: bool = False) -> bool:
+        self._roll_window()
+        self._offered += 1
+        if not force and self._kept >= self.max_per_second:
+            return False
+        self._kept += 1
+        return True
+
+
+class TracesSampler:
+    """Per-route head sampling with tail promotion of slow and failed requests.
+
+    A request is instrumented with the larger of its route rate and
+    ``tail_rate``. When it finishes, it is kept if it failed or was slow, and
+    otherwise with the probability that brings it back down to the route rate.
+    """
+
+    def __init__(
+        self,
+        default_rate: float,
+        route_rates: Dict[str, float],
+        tail_rate: float,
+        slow_seconds: float,
+        max_per_second: float,
+    ):
+        self.default_rate = default_rate
+        self.route_rates = route_rates
+        self.tail_rate = tail_rate
+        self.slow_seconds = slow_seconds
+        self.budget = TransactionBudget(max_per_second)
+
+    @classmethod
+    def from_settings(cls, settings: "CommonSettings") -> "TracesSampler":
+        return cls(
+            default_rate=settings.SENTRY_TRACES_SAMPLE_RATE,
+            route_rates=settings.SENTRY_ROUTE_TRACES_SAMPLE_RATES,
+            tail_rate=settings.SENTRY_TAIL_SAMPLE_RATE,
+            slow_seconds=settings.SENTRY_SLOW_TRANSACTION_SECONDS,
+            max_per_second=settings.SENTRY_MAX_TRANSACTIONS_PER_SECOND,
+        )
+
+    def route_rate(self, route: Optional[str]) -> float:
+        return self.route_rates.get(route, self.default_rate)
+
+    def instrumented_rate(self, route: Optional[str]) -> float:
+        return max(self.route_rate(route), self.tail_rate)
+
+    def __call__(self, sampling_context: Dict[str, Any]) -> float:
+        parent_sampled = sampling_context.get("parent_sampled")
+        if parent_sampled is not None:
+            return float(parent_sampled)
+        scope = sampling_context.get("asgi_scope")
+        route = route_label(scope) if scope and "app" in scope else None
+        return min(1.0, self.instrumented_rate(route) * self.budget.scale)
+
+    def is_failed(self, event: Dict[str, Any]) -> bool:
+        status = event.get("contexts", {}).get("trace", {}).get("status")
+        return status in SERVER_ERROR_STATUSES
+
+    def is_slow(self, event: Dict[str, Any]) -> bool:
+        # Timestamps are already serialized to ISO 8601 strings at this point.
+        finished = datetime.datetime.fromisoformat(event["timestamp"])
+        started = datetime.datetime.fromisoformat(event["start_timestamp"])
+        return (finished - started).total_seconds() >= self.slow_seconds
+
+    def before_send_transaction(self, event: Dict[str, Any], hint) -> Optional[dict]:
+        if self.is_failed(event):
+            self.budget.acquire(force=True)
+            return event
+        if not self.is_slow(event):
+            route = event.get("transaction")
+            instrumented_rate = self.instrumented_rate(route)
+            keep_rate = (
+                self.route_rate(route) / instrumented_rate if instrumented_rate else 1
+            )
+            if keep_rate < 1 and random.random() >= keep_rate:
+                return None
+        return event if self.budget.acquire() else None
+
+
+def init_sentry(settings: "CommonSettings") -> Optional[TracesSampler]:
+    """Sets Sentry up when a DSN is configured, without importing it otherwise.
+
+    Must run before any route is created, the FastAPI integration wraps route
+    handlers as they are built.
+    """
+    if not settings.SENTRY_DSN:
+        return None
+    import sentry_sdk
+    from sentry_sdk.integrations.fastapi import FastApiIntegration
+    from sentry_sdk.integrations.starlette import StarletteIntegration
+
+    traces_sampler = TracesSampler.from_settings(settings)
+    sentry_sdk.init(
+        dsn=settings.SENTRY_DSN,
+        traces_sampler=traces_sampler,
+        before_send_transaction=traces_sampler.before_send_transaction,
+        profiles_sample_rate=settings.SENTRY_PROFILES_SAMPLE_RATE,
+        # Probing for every supported library would import the installed ones.
+        auto_enabling_integrations=False,
+        integrations=[StarletteIntegration(), FastApiIntegration()],
+    )
+    return traces_sampler
@@ -0,0 +1,303 @@
+import asyncio
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import struct
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from app.utils.cache import LEADER_CANCELLED, AsyncTTLCache
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RSC1"
+# Magic and the index of the slot readers should use.
+HEADER = struct.Struct("<4sI")
+# Sequence (odd while the slot is written), expiry as a unix time, payload size.
+SLOT = struct.Struct("<QdI")
+READ_ATTEMPTS = 5
+
+
+class SharedSegment:
+    """A double-buffered snapshot in a memory-mapped file.
+
+    One process writes at a time, holding the file's ``flock``; it fills the
+    inactive slot and then flips the header to it. Readers take no lock and
+    retry when the slot's sequence was odd or changed while they copied it,
+    so they never see a torn write.
+    """
+
+    def __init__(self, path: str, slot_size: int):
+        self.slot_size = slot_size
+        size = HEADER.size + 2 * (SLOT.size + slot_size)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def _slot_offset(self, slot: int) -> int:
+        return HEADER.size + slot * (SLOT.size + self.slot_size)
+
+    def read(
+        self, known_version: Optional[Tuple[int, int]] = None
+    ) -> Optional[Tuple[Tuple[int, int], float, Optional[bytes]]]:
+        """Returns the active ``(version, expires_at, payload)``, if any.
+
+        The payload is ``None`` when the version is ``known_version``.
+        """
+        for _ in range(READ_ATTEMPTS):
+            magic, active = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                return None
+            offset = self._slot_offset(active)
+            sequence, expires_at, length = SLOT.unpack_from(self._map, offset)
+            if sequence % 2:
+                continue
+            version = (active, sequence)
+            payload = None
+            if version != known_version:
+                start = offset + SLOT.size
+                payload = self._map[start : start + length]
+            if SLOT.unpack_from(self._map, offset)[0] == sequence:
+                return version, expires_at, payload
+        return None
+
+    def write(self, payload: bytes, expires_at: float) -> bool:
+        """Publishes a snapshot, only call it while holding the lock."""
+        if len(payload) > self.slot_size:
+            return False
+        magic, active = HEADER.unpack_from(self._map, 0)
+        slot = 1 - active if magic == MAGIC else 0
+        offset = self._slot_offset(slot)
+        sequence = SLOT.unpack_from(self._map, offset)[0]
+        # Left odd by a writer that died mid-write.
+        sequence += sequence % 2
+        SLOT.pack_into(self._map, offset, sequence + 1, expires_at, len(payload))
+        start = offset + SLOT.size
+        self._map[start : start + len(payload)] = payload
+        SLOT.pack_into(self._map, offset, sequence + 2, expires_at, len(payload))
+        HEADER.pack_into(self._map, 0, MAGIC, slot)
+        return True
+
+    def try_lock(self) -> bool:
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def unlock(self):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class SharedTTLCache:
+    """``AsyncTTLCache`` whose entries are shared by every worker on the host.
+
+    Keys hash into ``max_size`` segment files under ``directory``, each holding
+    the latest snapshot of one key. A worker that finds its key missing or
+    expired refreshes it only if it wins the segment's ``flock``; the others
+    wait up to ``wait_timeout`` for that snapshot before loading it themselves.
+    A segment is never taken over while it holds another fresh key, keys that
+    collide with it are cached by each worker instead, as are entries too
+    large for a segment. Snapshots are pickled, so the directory must only be
+    writable by the app's user.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        directory: str,
+        ttl: float,
+        max_size: int = 128,
+        slot_size: int = 1 << 20,
+        wait_timeout: float = 5,
+        poll_interval: float = 0.01,
+    ):
+        self.name = name
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.slot_size = slot_size
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._segments: Dict[int, SharedSegment] = {}
+        # flock is per open file, so it can't keep coroutines of this process
+        # from refreshing two keys of one segment at once.
+        self._locked: Set[int] = set()
+        # Decoded snapshots by segment, so unchanged ones are not unpickled again.
+        self._decoded: Dict[int, Tuple[Tuple[int, int], Any]] = {}
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        # For keys whose segment is held by another key.
+        self._local = AsyncTTLCache(ttl=ttl, max_size=max_size)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.waited = 0
+
+    def _bucket(self, key: Hashable) -> int:
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.max_size
+
+    def _segment(self, bucket: int) -> SharedSegment:
+        segment = self._segments.get(bucket)
+        if segment is None:
+            path = os.path.join(self.directory, f"{self.name}-{bucket:05d}.seg")
+            segment = self._segments[bucket] = SharedSegment(path, self.slot_size)
+        return segment
+
+    def _read_fresh(self, bucket: int) -> Optional[Tuple[str, bool, Any]]:
+        """Returns ``(key, shared, value)`` of the segment's fresh snapshot.
+
+        ``key`` is the ``repr`` of the cached key. ``shared`` is false for
+        entries too large for a segment, whose value is not stored.
+        """
+        decoded = self._decoded.get(bucket)
+        snapshot = self._segment(bucket).read(decoded[0] if decoded else None)
+        if snapshot is None:
+            return None
+        version, expires_at, payload = snapshot
+        if expires_at <= time.time():
+            return None
+        if payload is not None:
+            decoded = self._decoded[bucket] = (version, pickle.loads(payload))
+        return decoded[1]
+
+    async def get_or_set(
+        self, key: Hashable, factory: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        bucket = self._bucket(key)
+        while True:
+            entry = self._read_fresh(bucket)
+            if entry is not None:
+                stored_key, shared, value = entry
+                if stored_key == repr(key) and shared:
+                    self.hits += 1
+                    return value
+                return await self._local.get_or_set(key, factory)
+
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+            self.coalesced += 1
+            value = await asyncio.shield(in_flight)
+            if value is not LEADER_CANCELLED:
+                return value
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await self._refresh(bucket, key, factory)
+        except asyncio.CancelledError:
+            future.set_result(LEADER_CANCELLED)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting.
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            del self._in_flight[key]
+
+    async def _refresh(
+        self, bucket: int, key: Hashable, factory: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        segment = self._segment(bucket)
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            if bucket not in self._locked and segment.try_lock():
+                self._locked.add(bucket)
+                try:
+                    return await self._load_and_publish(segment, bucket, key, factory)
+                finally:
+                    self._locked.discard(bucket)
+                    segment.unlock()
+
+            self.waited += 1
+            await asyncio.sleep(self.poll_interval)
+            entry = self._read_fresh(bucket)
+            if entry is not None:
+                stored_key, shared, value = entry
+                if stored_key == repr(key) and shared:
+                    return value
+                return await self._local.get_or_set(key, factory)
+            if time.monotonic() > deadline:
+                return await factory()
+
+    async def _load_and_publish(
+        self,
+        segment: SharedSegment,
+        bucket: int,
+        key: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        # Another worker may have published since the last check, this key
+        # or one that now holds the segment until it expires.
+        entry = self._read_fresh(bucket)
+        if entry is not None:
+            stored_key, shared, value = entry
+            if stored_key == repr(key) and shared:
+                return value
+            return await self._local.get_or_set(key, factory)
+        value = await factory()
+        expires_at = time.time() + self.ttl
+        payload = pickle.dumps((repr(key), True, value), pickle.HIGHEST_PROTOCOL)
+        if not segment.write(payload, expires_at):
+            logger.warning(
+                "%s entry of %d bytes does not fit a shared segment",
+                self.name,
+                len(payload),
+            )
+            # Tells the waiting workers to stop waiting and load it themselves.
+            segment.write(pickle.dumps((repr(key), False, None)), expires_at)
+            # Later lookups here find the marker and read the local cache.
+            self._local.set(key, value)
+        return value
+
+    def clear(self):
+        """Drops this process' handles, the shared snapshots stay."""
+        for segment in self._segments.values():
+            segment.close()
+        self._segments.clear()
+        self._decoded.clear()
+        self._local.clear()
+
+    def stats(self) -> Dict[str, int]:
+        local = self._local.stats()
+        return {
+            "hits": self.hits + local["hits"],
+            "misses": self.misses + local["misses"],
+            "coalesced": self.coalesced + local["coalesced"],
+            "waited": self.waited,
+            "local": local["size"],
+            "size": len(self._decoded) + local["size"],
+        }
+
+
+def ttl_cache(
+    name: str,
+    ttl: float,
+    max_size: int,
+    shared_directory: Optional[str] = None,
+    slot_size: int = 1 << 20,
+):
+    """Returns a cache shared by all workers when a directory is configured."""
+    if shared_directory:
+        return SharedTTLCache(name, shared_directory, ttl, max_size, slot_size)
+    return AsyncTTLCache(ttl=ttl, max_size=max_size)
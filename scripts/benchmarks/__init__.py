@@ -0,0 +1,24 @@
+import os
+
+REQUIRED_SETTINGS = {
+    # An empty DSN keeps Sentry disabled.
+    "SENTRY_DSN": "",
+    "MONGODB_URL": "mongodb://localhost:27017",
+    "OSU_CLIENT_ID": "stub",
+    "OSU_CLIENT_SECRET": "stub",
+    "OSU_REDIRECT_URI": "http://localhost/oauth2/osu-redirect",
+    "TWITCH_CLIENT_ID": "stub",
+    "TWITCH_CLIENT_SECRET": "stub",
+    "TWITCH_REDIRECT_URI": "http://localhost/oauth2/twitch-redirect",
+    "JWT_SECRET_KEY": "stub",
+}
+
+
+def stub_environment(**overrides: str):
+    """Fills in placeholder settings so ``app.config`` can be imported offline.
+
+    Must run before anything from ``app`` is imported.
+    """
+    os.environ.update(overrides)
+    for name, value in REQUIRED_SETTINGS.items():
+        os.environ.setdefault(name, value)
@@ -0,0 +1,175 @@
+"""Measures cold start of the app and fails when it exceeds a time budget.
+
+Every run starts a fresh interpreter. Without ``--mongodb-url`` only the
+import of ``app.main`` is timed; with it, uvicorn is started as well and the
+time until ``/live/users`` is first answered is measured. Starting the
+upstream HTTP pool, which the first osu! or Twitch call does, is always timed
+after the import since that cost moved there from startup::
+
+    python -m scripts.benchmarks.cold_start --runs 5 --import-budget 1.0
+    python -m scripts.benchmarks.cold_start --mongodb-url mongodb://localhost:27017 \\
+        --first-request-budget 3.0
+
+Exits non-zero if the median of a measurement is over its budget.
+``--importtime`` lists the slowest modules imported by ``app.main``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from scripts.benchmarks import stub_environment
+
+IMPORT_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import app.main
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+}))
+"""
+
+POOL_START_PROBE = """
+import asyncio, json, resource, time
+import app.main
+from app.utils.http import UpstreamHTTPClient
+
+async def start():
+    client = UpstreamHTTPClient()
+    started = time.perf_counter()
+    await client.start()
+    seconds = time.perf_counter() - started
+    await client.close()
+    return seconds
+
+print(json.dumps({
+    "seconds": asyncio.run(start()),
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=1.0)
+    parser.add_argument("--pool-start-budget", type=float, default=0.5)
+    parser.add_argument("--mongodb-url", help="Also time the first served request.")
+    parser.add_argument("--database", default="RonniaBenchmark")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--first-request-budget", type=float, default=3.0)
+    parser.add_argument("--importtime", type=int, default=0, metavar="N")
+    return parser.parse_args()
+
+
+def run_probe(probe: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", probe],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure_first_request(port: int, timeout: float = 60) -> dict:
+    url = f"http://127.0.0.1:{port}/live/users?limit=1"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError("The server exited before answering.")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        else:
+            raise RuntimeError(f"No answer within {timeout}s.")
+        return {"seconds": time.perf_counter() - started, "rss_mb": rss_mb(server.pid)}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def slowest_imports(count: int):
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        # Only modules imported directly by the app or its direct dependencies.
+        if len(name) - len(name.lstrip()) <= 3:
+            rows.append((int(cumulative), name.strip()))
+    for cumulative, name in sorted(rows, reverse=True)[:count]:
+        print(f"{cumulative / 1000:8.1f}ms  {name}")
+
+
+def report(name: str, runs: list, budget: float) -> bool:
+    median = statistics.median(run["seconds"] for run in runs)
+    rss = statistics.median(run["rss_mb"] for run in runs)
+    within = median <= budget
+    print(
+        f"{name:>14}: median {median:.3f}s (budget {budget:.3f}s), "
+        f"max RSS {rss:.1f}MB{'' if within else '  OVER BUDGET'}"
+    )
+    return within
+
+
+def main():
+    args = parse_args()
+    overrides = {"LOG_LEVEL": "WARNING"}
+    if args.mongodb_url:
+        overrides.update(MONGODB_URL=args.mongodb_url, MONGODB_DATABASE=args.database)
+    stub_environment(**overrides)
+    os.environ.setdefault("PYTHONPATH", os.getcwd())
+
+    if args.importtime:
+        slowest_imports(args.importtime)
+
+    ok = report(
+        "import",
+        [run_probe(IMPORT_PROBE) for _ in range(args.runs)],
+        args.import_budget,
+    )
+    ok = (
+        report(
+            "pool start",
+            [run_probe(POOL_START_PROBE) for _ in range(args.runs)],
+            args.pool_start_budget,
+        )
+        and ok
+    )
+    if args.mongodb_url:
+        runs = [measure_first_request(args.port) for _ in range(args.runs)]
+        ok = report("first request", runs, args.first_request_budget) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
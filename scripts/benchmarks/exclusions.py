@@ -0,0 +1,112 @@
+"""Compares excluded-chatter checks and edits with and without the exclusion index.
+
+Seeds channels with thousands of excluded names on a local mongod, then times
+membership checks that load the whole list per check against the in-memory
+index, and one-name-per-update edits against a single bulk update::
+
+    python -m scripts.benchmarks.exclusions --mongodb-url mongodb://localhost:27017 \\
+        --channels 200 --names 5000
+
+The ``--database`` (``RonniaBenchmark`` by default) is dropped and reseeded on
+every run, so never point it at a database holding real data.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from scripts.benchmarks import stub_environment
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongodb-url", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="RonniaBenchmark")
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--names", type=int, default=5000)
+    parser.add_argument("--checks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--edits", type=int, default=200)
+    return parser.parse_args()
+
+
+def report(name: str, count: int, seconds: float):
+    print(f"{name:>28}: {seconds / count * 1e6:9.1f}us each, {count / seconds:9.0f}/s")
+
+
+async def main():
+    args = parse_args()
+    stub_environment(MONGODB_URL=args.mongodb_url)
+    from app.db.indexes import ensure_indexes
+    from app.db.mongodb import AsyncMongoClient
+
+    mongo_db = AsyncMongoClient(args.mongodb_url, database_name=args.database)
+    await mongo_db.drop_database(args.database)
+    await ensure_indexes(mongo_db.users_db)
+    await mongo_db.users_collection.insert_many(
+        [
+            {
+                "osuId": channel,
+                "osuUsername": f"osu_user_{channel}",
+                "twitchId": channel,
+                "twitchUsername": f"twitch_user_{channel}",
+                "excludedUsers": [f"Chatter_{i}" for i in range(args.names)],
+            }
+            for channel in range(1, args.channels + 1)
+        ]
+    )
+    print(f"Seeded {args.channels} channels with {args.names} excluded names each.")
+
+    pairs = [
+        (
+            random.randint(1, args.channels),
+            f"chatter_{random.randint(0, 2 * args.names)}",
+        )
+        for _ in range(args.checks)
+    ]
+
+    started = time.perf_counter()
+    for channel, name in pairs:
+        excluded = await mongo_db.get_excluded_users(channel)
+        name in (excluded_name.lower() for excluded_name in excluded)
+    report("whole list per check", len(pairs), time.perf_counter() - started)
+
+    index = mongo_db.exclusions
+    started = time.perf_counter()
+    for channel, name in pairs:
+        await index.is_excluded(channel, name)
+    report("index, cold", len(pairs), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for channel, name in pairs:
+        await index.is_excluded(channel, name)
+    report("index, warm", len(pairs), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for i in range(0, len(pairs), args.batch_size):
+        await index.check_many(pairs[i : i + args.batch_size])
+    report(
+        f"index, batches of {args.batch_size}",
+        len(pairs),
+        time.perf_counter() - started,
+    )
+
+    names = [f"new_chatter_{i}" for i in range(args.edits)]
+    started = time.perf_counter()
+    for name in names:
+        await mongo_db.add_excluded_user(1, name)
+    report("add one name per update", len(names), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await mongo_db.add_excluded_users(2, names)
+    report("add all names in one update", len(names), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await mongo_db.remove_excluded_users(2, names)
+    report("remove all in one update", len(names), time.perf_counter() - started)
+
+    mongo_db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+"""Measures cookie token verification throughput with and without the cache.
+
+    python -m scripts.benchmarks.jwt_cache --tokens 100 --decodes 100000
+"""
+import argparse
+import time
+
+from scripts.benchmarks import stub_environment
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--decodes", type=int, default=100000)
+    args = parser.parse_args()
+
+    stub_environment()
+    from app.utils.jwt import decode_jwt, obtain_jwt, token_cache
+
+    tokens = [
+        obtain_jwt({"osuId": i, "twitchId": i, "osuUsername": f"user{i}"})
+        for i in range(args.tokens)
+    ]
+
+    for name, max_size in (("cache off", 0), ("cache on", args.tokens)):
+        token_cache.clear()
+        token_cache.max_size = max_size
+        started = time.perf_counter()
+        for i in range(args.decodes):
+            decode_jwt(tokens[i % args.tokens])
+        elapsed = time.perf_counter() - started
+        print(
+            f"{name:>9}: {args.decodes / elapsed:,.0f} decodes/s "
+            f"({elapsed / args.decodes * 1e6:.1f}us each)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Offline load test for every route of the API.
+
+Seeds a scratch database on a local mongod, starts the osu!/Twitch stub API
+and the app itself in-process, then drives each route at a fixed concurrency
+and writes requests per second and latency percentiles to a JSON file that
+can be compared between commits::
+
+    python -m scripts.benchmarks.load_test --mongodb-url mongodb://localhost:27017 \\
+        --requests 2000 --concurrency 50 --output bench_results.json
+
+The ``--database`` (``RonniaBenchmark`` by default) is dropped and reseeded on
+every run, so never point it at a database holding real data.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from typing import List, NamedTuple, Optional
+
+import aiohttp
+
+from scripts.benchmarks import stub_environment
+from scripts.stub_api import fake_beatmap, start_stub_api
+
+
+class Route(NamedTuple):
+    name: str
+    method: str
+    path: str
+    authenticated: bool = False
+
+
+ROUTES = [
+    Route("live_users", "GET", "/live/users?limit=20"),
+    Route("live_users_cursor", "GET", "/live/users?limit=20&cursor="),
+    Route("top_daily", "GET", "/requests/beatmaps/top/daily?limit=10"),
+    Route("top_weekly", "GET", "/requests/beatmaps/top/weekly?limit=10"),
+    Route("top_monthly", "GET", "/requests/beatmaps/top/monthly?limit=50"),
+    Route("user_me", "GET", "/user/me", authenticated=True),
+    Route("user_settings", "GET", "/user/settings", authenticated=True),
+    Route("user_exclude", "GET", "/user/exclude", authenticated=True),
+    Route("osu_login", "GET", "/oauth2/osu-login"),
+    Route("osu_redirect", "GET", "/oauth2/osu-redirect?code=stub&state=/"),
+    Route("twitch_redirect", "GET", "/oauth2/twitch-redirect?code=stub&state=/"),
+]
+
+DEFAULT_SETTINGS = [
+    {"name": "echo", "value": 1, "type": "value"},
+    {"name": "enable", "value": 1, "type": "value"},
+    {"name": "sub-only", "value": 0, "type": "value"},
+    {"name": "points-only", "value": 0, "type": "value"},
+    {"name": "test", "value": 0, "type": "value"},
+    {"name": "cooldown", "value": 30, "type": "value"},
+    {"name": "sr", "value": [0, -1], "type": "range"},
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongodb-url", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="RonniaBenchmark")
+    parser.add_argument("--app-port", type=int, default=8780)
+    parser.add_argument("--stub-port", type=int, default=8765)
+    parser.add_argument("--stub-latency", type=float, default=0.0)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--live-ratio", type=float, default=0.1)
+    parser.add_argument("--excluded-per-user", type=int, default=50)
+    parser.add_argument("--beatmaps", type=int, default=5000)
+    parser.add_argument("--statistics", type=int, default=500000)
+    parser.add_argument("--routes", nargs="*", help="Only run these route names.")
+    parser.add_argument("--output", default="bench_results.json")
+    return parser.parse_args()
+
+
+async def insert_in_chunks(collection, documents, chunk_size: int = 10000):
+    for i in range(0, len(documents), chunk_size):
+        await collection.insert_many(documents[i : i + chunk_size], ordered=False)
+
+
+async def seed(mongo_db, args):
+    from app.db.indexes import ensure_indexes
+
+    print(f"Seeding {args.database}...")
+    await mongo_db.drop_database(args.database)
+    await ensure_indexes(mongo_db.users_db)
+    await mongo_db.settings_collection.insert_many(
+        [dict(setting) for setting in DEFAULT_SETTINGS]
+    )
+
+    users = []
+    for user_id in range(1, args.users + 1):
+        users.append(
+            {
+                "osuId": user_id,
+                "osuUsername": f"osu_user_{user_id}",
+                "osuAvatarUrl": f"https://a.ppy.sh/{user_id}",
+                "twitchId": user_id,
+                "twitchUsername": f"twitch_user_{user_id}",
+                "twitchAvatarUrl": f"https://static-cdn.jtvnw.net/{user_id}.png",
+                "excludedUsers": [
+                    f"chatter_{i}" for i in range(args.excluded_per_user)
+                ],
+                "isLive": random.random() < args.live_ratio,
+                "settings": {"echo": True, "enable": True, "cooldown": 30},
+            }
+        )
+    await insert_in_chunks(mongo_db.users_collection, users)
+
+    await insert_in_chunks(
+        mongo_db.beatmaps_collection,
+        [fake_beatmap(beatmap_id) for beatmap_id in range(1, args.beatmaps + 1)],
+        chunk_size=1000,
+    )
+
+    # Popularity is skewed so the top lists have a stable head and a long tail.
+    now = datetime.datetime.utcnow()
+    beatmap_ids = list(range(1, args.beatmaps + 1))
+    weights = [1 / beatmap_id for beatmap_id in beatmap_ids]
+    requested = random.choices(beatmap_ids, weights=weights, k=args.statistics)
+    events = [
+        {
+            "requested_beatmap_id": beatmap_id,
+            "timestamp": now
+            - datetime.timedelta(seconds=random.uniform(0, 40 * 86400)),
+        }
+        for beatmap_id in requested
+    ]
+    await insert_in_chunks(mongo_db.statistics_collection, events)
+    await mongo_db.beatmap_rollup.backfill()
+    print(
+        f"Seeded {args.users} users, {args.beatmaps} beatmaps "
+        f"and {args.statistics} statistics."
+    )
+
+
+async def start_app(port: int):
+    import uvicorn
+
+    from app.main import app
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+async def drive(
+    session: aiohttp.ClientSession,
+    base_url: str,
+    route: Route,
+    requests: int,
+    concurrency: int,
+    cookies: Optional[dict],
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async with session.request(
+                    route.method,
+                    f"{base_url}{route.path}",
+                    cookies=cookies,
+                    allow_redirects=False,
+                ) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / elapsed,
+        "p50_ms": quantiles[49],
+        "p95_ms": quantiles[94],
+        "p99_ms": quantiles[98],
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main():
+    args = parse_args()
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    stub_environment(
+        MONGODB_URL=args.mongodb_url,
+        MONGODB_DATABASE=args.database,
+        OSU_BASE_URL=stub_url,
+        TWITCH_ID_BASE_URL=stub_url,
+        TWITCH_API_BASE_URL=stub_url,
+    )
+    from app.db.mongodb import AsyncMongoClient
+    from app.utils.jwt import obtain_jwt
+
+    mongo_db = AsyncMongoClient(args.mongodb_url, database_name=args.database)
+    await seed(mongo_db, args)
+    mongo_db.close()
+
+    stub_runner = await start_stub_api(args.stub_port, args.stub_latency)
+    server, server_task = await start_app(args.app_port)
+    base_url = f"http://127.0.0.1:{args.app_port}"
+    cookies = {"token": obtain_jwt({"osuId": 1, "twitchId": 1})}
+
+    results = {}
+    try:
+        connector = aiohttp.TCPConnector(limit=args.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            for route in ROUTES:
+                if args.routes and route.name not in args.routes:
+                    continue
+                route_cookies = cookies if route.authenticated else None
+                await drive(session, base_url, route, args.warmup, 1, route_cookies)
+                result = await drive(
+                    session,
+                    base_url,
+                    route,
+                    args.requests,
+                    args.concurrency,
+                    route_cookies,
+                )
+                results[route.name] = result
+                print(
+                    f"{route.name:>18}: rps={result['rps']:8.1f} "
+                    f"p50={result['p50_ms']:7.2f}ms p95={result['p95_ms']:7.2f}ms "
+                    f"p99={result['p99_ms']:7.2f}ms errors={result['errors']}"
+                )
+    finally:
+        server.should_exit = True
+        await server_task
+        await stub_runner.cleanup()
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "parameters": {
+            key: value for key, value in vars(args).items() if key != "output"
+        },
+        "routes": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""Benchmarks the osu! login round trips against the local stub API.
+
+Compares a fresh ``aiohttp.ClientSession`` per call, as the handlers used to
+do, with the shared ``UpstreamHTTPClient``. The stub speaks plain HTTP, so
+the difference shown excludes TLS handshakes::
+
+    python -m scripts.benchmarks.login_flow --logins 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import aiohttp
+
+from scripts.benchmarks import stub_environment
+from scripts.stub_api import start_stub_api
+
+
+def configure_environment(port: int):
+    base_url = f"http://127.0.0.1:{port}"
+    stub_environment(
+        OSU_BASE_URL=base_url,
+        TWITCH_ID_BASE_URL=base_url,
+        TWITCH_API_BASE_URL=base_url,
+    )
+
+
+async def login_with_fresh_sessions(handler) -> None:
+    async with aiohttp.ClientSession() as session:
+        async with session.post(handler._oauth_handler.token_url, json={}) as r:
+            token = await r.json()
+    headers = {"Authorization": f"Bearer {token['access_token']}"}
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async with session.get(handler.me_url) as r:
+            await r.json()
+
+
+async def login_with_shared_client(handler) -> None:
+    token = await handler._get_token("stub-code")
+    await handler._get_user_from_token(token.access_token)
+
+
+async def run(name: str, login, handler_factory, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await login(handler_factory())
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:>15}: logins/s={logins / elapsed:.0f} "
+        f"p50={quantiles[49]:.2f}ms p99={quantiles[98]:.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--logins", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    configure_environment(args.port)
+    from app.utils.http import UpstreamHTTPClient
+    from app.utils.login import OsuLoginHandler
+
+    runner = await start_stub_api(args.port, args.latency)
+    http_client = UpstreamHTTPClient()
+    await http_client.start()
+    try:
+
+        def handler_factory():
+            return OsuLoginHandler(mongo_db=None, http_client=http_client)
+
+        await run(
+            "fresh sessions",
+            login_with_fresh_sessions,
+            handler_factory,
+            args.logins,
+            args.concurrency,
+        )
+        await run(
+            "shared client",
+            login_with_shared_client,
+            handler_factory,
+            args.logins,
+            args.concurrency,
+        )
+        for host, stats in http_client.stats().items():
+            print(f"{host}: {stats}")
+    finally:
+        await http_client.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""Compares one client per router with a single shared client.
+
+Runs the same concurrent ``Users`` lookups through both layouts and prints the
+number of server connections they open and their latency percentiles::
+
+    python -m scripts.benchmarks.mongo_pool --requests 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import List
+
+from app.db.mongodb import AsyncMongoClient
+
+ROUTER_COUNT = 4
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    return statistics.quantiles(samples, n=100)[int(percent) - 1]
+
+
+async def run(clients: List[AsyncMongoClient], requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def lookup(i: int):
+        client = clients[i % len(clients)]
+        async with semaphore:
+            started = time.perf_counter()
+            await client.users_collection.find_one({"osuId": i})
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(lookup(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    return latencies, elapsed
+
+
+async def current_connections(url: str) -> int:
+    probe = AsyncMongoClient(url, maxPoolSize=1)
+    try:
+        status = await probe.admin.command("serverStatus")
+        # The probe's own connection is not part of the measured layout.
+        return status["connections"]["current"] - 1
+    finally:
+        probe.close()
+
+
+async def measure(name: str, url: str, clients: List[AsyncMongoClient], args):
+    baseline = await current_connections(url)
+    latencies, elapsed = await run(clients, args.requests, args.concurrency)
+    connections = await current_connections(url) - baseline
+    for client in clients:
+        client.close()
+    print(
+        f"{name:>10}: clients={len(clients)} connections={connections} "
+        f"rps={args.requests / elapsed:.0f} "
+        f"p50={percentile(latencies, 50):.2f}ms p99={percentile(latencies, 99):.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=os.getenv("MONGODB_URL"))
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--max-pool-size", type=int, default=100)
+    args = parser.parse_args()
+
+    per_router = [
+        AsyncMongoClient(args.url, maxPoolSize=args.max_pool_size)
+        for _ in range(ROUTER_COUNT)
+    ]
+    await measure("per-router", args.url, per_router, args)
+
+    shared = [AsyncMongoClient(args.url, maxPoolSize=args.max_pool_size)]
+    await measure("shared", args.url, shared, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
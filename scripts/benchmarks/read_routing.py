@@ -0,0 +1,144 @@
+"""Checks which replica set members serve the analytics and user reads.
+
+Needs a replica set with at least one secondary. A local three-member set can
+be started with::
+
+    for port in 27017 27018 27019; do
+        mkdir -p /tmp/rs/$port
+        mongod --replSet rs0 --port $port --dbpath /tmp/rs/$port --fork \\
+            --logpath /tmp/rs/$port.log
+    done
+    mongosh --port 27017 --eval 'rs.initiate({_id: "rs0", members: [
+        {_id: 0, host: "localhost:27017"},
+        {_id: 1, host: "localhost:27018"},
+        {_id: 2, host: "localhost:27019"}]})'
+
+    python -m scripts.benchmarks.read_routing \\
+        --mongodb-url "mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0"
+
+Each read is run ``--rounds`` times with the read preferences from the
+settings and the member that answered is recorded. Exits non-zero if an
+analytics read reached the primary while a secondary was up, or a user read
+did not reach the primary. The ``--database`` (``RonniaBenchmark`` by
+default) is dropped and reseeded, so never point it at a database holding
+real data.
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import sys
+
+from pymongo import monitoring
+from pymongo.write_concern import WriteConcern
+
+from scripts.benchmarks import stub_environment
+
+READ_COMMANDS = ("find", "aggregate")
+
+
+class ReadRecorder(monitoring.CommandListener):
+    def __init__(self):
+        self.label = None
+        self.reads = collections.defaultdict(collections.Counter)
+
+    def started(self, event):
+        if self.label is not None and event.command_name in READ_COMMANDS:
+            self.reads[self.label][event.connection_id] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongodb-url", required=True)
+    parser.add_argument("--database", default="RonniaBenchmark")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=20)
+    return parser.parse_args()
+
+
+async def seed(mongo_db, users: int):
+    from app.db.indexes import ensure_indexes
+
+    # Acknowledged by every member, so the secondaries hold the same data.
+    database = mongo_db.users_db.with_options(
+        write_concern=WriteConcern(w=len(mongo_db.nodes))
+    )
+    await ensure_indexes(mongo_db.users_db)
+    now = datetime.datetime.utcnow()
+    await database.Users.insert_many(
+        [
+            {
+                "osuId": osu_id,
+                "twitchId": osu_id,
+                "twitchUsername": f"streamer_{osu_id}",
+                "isLive": osu_id % 2 == 0,
+                "excludedUsers": [],
+                "settings": {},
+            }
+            for osu_id in range(1, users + 1)
+        ]
+    )
+    await database.Beatmaps.insert_many(
+        [{"_id": beatmap_id, "title": f"map {beatmap_id}"} for beatmap_id in range(20)]
+    )
+    await database.Statistics.insert_many(
+        [{"requested_beatmap_id": i % 20, "timestamp": now} for i in range(users * 10)]
+    )
+    await mongo_db.beatmap_rollup.backfill()
+
+
+async def main():
+    args = parse_args()
+    stub_environment(MONGODB_URL=args.mongodb_url, MONGODB_DATABASE=args.database)
+    from app.config import settings
+    from app.db.mongodb import AsyncMongoClient
+
+    recorder = ReadRecorder()
+    mongo_db = AsyncMongoClient.from_settings(settings, [recorder])
+    await mongo_db.admin.command("ping")
+    await mongo_db.drop_database(args.database)
+    await seed(mongo_db, args.users)
+
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+    analytics = {
+        "top beatmaps": lambda: mongo_db.get_top_requested_beatmaps(10, 0, since),
+        "top beatmaps (rollups)": lambda: (
+            mongo_db.beatmap_rollup.get_top_requested_beatmaps(10, 0, since)
+        ),
+        "live users": lambda: mongo_db.get_live_user_names(50),
+    }
+    user = {
+        "user": lambda: mongo_db.get_user_from_osu_id(1),
+        "user settings": lambda: mongo_db.get_user_settings(1),
+    }
+    for label, read in {**analytics, **user}.items():
+        recorder.label = label
+        for _ in range(args.rounds):
+            await read()
+    recorder.label = None
+
+    primary, secondaries = mongo_db.primary, mongo_db.secondaries
+    mongo_db.close()
+
+    ok = True
+    for label, members in recorder.reads.items():
+        on_primary = members.get(primary, 0)
+        total = sum(members.values())
+        expected_primary = label in user or not secondaries
+        routed = on_primary == total if expected_primary else on_primary == 0
+        ok = ok and routed
+        print(
+            f"{label:>22}: {total - on_primary:3} of {total:3} reads on secondaries"
+            f"{'' if routed else '  UNEXPECTED'}"
+        )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""Measures the per-request cost of Sentry tracing at different sampling settings.
+
+Requests go straight to an in-process FastAPI app, and events are handed to a
+transport that only counts them, so the numbers are the SDK's own overhead::
+
+    python -m scripts.benchmarks.sentry_sampling --requests 5000
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+import sentry_sdk
+from fastapi import FastAPI
+from sentry_sdk.transport import Transport
+
+from scripts.benchmarks import stub_environment
+
+DSN = "https://public@sentry.invalid/1"
+
+
+class CountingTransport(Transport):
+    def __init__(self, options=None):
+        super().__init__(options)
+        self.transactions = 0
+
+    def capture_envelope(self, envelope):
+        if envelope.get_transaction_event() is not None:
+            self.transactions += 1
+
+    def capture_event(self, event):
+        pass
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/requests/beatmaps/top/daily")
+    async def top_daily():
+        await asyncio.sleep(0)
+        return [{"id": i, "count": 100 - i} for i in range(10)]
+
+    return app
+
+
+async def run(app: FastAPI, requests: int) -> float:
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        for _ in range(100):
+            await client.get("/requests/beatmaps/top/daily")
+        started = time.perf_counter()
+        for _ in range(requests):
+            await client.get("/requests/beatmaps/top/daily")
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    stub_environment()
+    from app.utils.sentry import TracesSampler
+
+    def sampler(rate, tail_rate=0.0, max_per_second=1e9):
+        traces_sampler = TracesSampler(rate, {}, tail_rate, 1.0, max_per_second)
+        return {
+            "traces_sampler": traces_sampler,
+            "before_send_transaction": traces_sampler.before_send_transaction,
+        }
+
+    configurations = [
+        ("sentry off", None),
+        ("100% (previous)", {"traces_sample_rate": 1.0}),
+        ("sampler 5% (default)", sampler(0.05)),
+        ("sampler 5%, 25% tail", sampler(0.05, tail_rate=0.25)),
+        ("sampler 100%, budget 10/s", sampler(1.0, max_per_second=10)),
+        ("sampler 5%, profiling", {**sampler(0.05), "profiles_sample_rate": 1.0}),
+    ]
+
+    baseline = None
+    for name, options in configurations:
+        transport = CountingTransport()
+        if options is None:
+            sentry_sdk.init(dsn=None)
+        else:
+            sentry_sdk.init(dsn=DSN, transport=transport, **options)
+        elapsed = asyncio.run(run(create_app(), args.requests))
+        per_request = elapsed / args.requests * 1e6
+        if baseline is None:
+            baseline = per_request
+        print(
+            f"{name:>26}: {per_request:7.1f}us/request "
+            f"(+{per_request - baseline:6.1f}us), "
+            f"{transport.transactions} transactions sent"
+        )
+
+
+if __name__ == "__main__":
+    main()
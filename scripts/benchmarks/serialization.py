@@ -0,0 +1,91 @@
+"""Compares encoding time and response size of top-beatmaps pages.
+
+Pages are built from stub osu! beatmap documents merged with their request
+counts, like the rollup query returns them::
+
+    python -m scripts.benchmarks.serialization --limit 50 --rounds 200
+"""
+import argparse
+import datetime
+import gzip
+import json
+import time
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from scripts.benchmarks import stub_environment
+from scripts.stub_api import fake_beatmap
+
+
+def beatmap_page(limit: int):
+    return [
+        {
+            **fake_beatmap(beatmap_id),
+            "_id": beatmap_id,
+            "count": 1000 - beatmap_id,
+            "last_updated": datetime.datetime.utcnow(),
+            "beatmapDocumentId": ObjectId(),
+        }
+        for beatmap_id in range(1, limit + 1)
+    ]
+
+
+def timed(function, rounds: int):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        result = function()
+    return (time.perf_counter() - started) / rounds * 1e6, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    stub_environment()
+    from app.utils.compression import BrotliCompressor, GzipCompressor, brotli
+    from app.utils.responses import dumps
+
+    page = beatmap_page(args.limit)
+
+    def stdlib():
+        content = jsonable_encoder(page, custom_encoder={ObjectId: str})
+        return json.dumps(
+            content, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode()
+
+    encoders = [("jsonable_encoder + json", stdlib), ("orjson", lambda: dumps(page))]
+    for name, encode in encoders:
+        micros, body = timed(encode, args.rounds)
+        print(f"{name:>24}: {micros:8.0f}us per page, {len(body):,} bytes")
+
+    body = dumps(page)
+
+    def compress_with(factory):
+        def compress():
+            compressor = factory()
+            return compressor.compress(body) + compressor.finish()
+
+        return compress
+
+    compressors = [
+        ("gzip 6", compress_with(lambda: GzipCompressor(6))),
+        ("gzip 9 (starlette)", lambda: gzip.compress(body, compresslevel=9)),
+    ]
+    if brotli is not None:
+        compressors += [
+            ("brotli 4", compress_with(lambda: BrotliCompressor(4))),
+            ("brotli 11", compress_with(lambda: BrotliCompressor(11))),
+        ]
+    for name, compress in compressors:
+        micros, compressed = timed(compress, args.rounds)
+        print(
+            f"{name:>24}: {micros:8.0f}us per page, {len(compressed):,} bytes "
+            f"({len(compressed) / len(body):.0%} of identity)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Compares per-worker caches with the shared-memory cache across processes.
+
+Starts ``--workers`` processes that each read a set of keys for a while, with
+a factory that stands in for the database query, and counts how often the
+factory ran and how long cache hits take::
+
+    python -m scripts.benchmarks.shared_cache --workers 4 --keys 20 --seconds 5
+    python -m scripts.benchmarks.shared_cache --keys 6 --max-size 4
+
+No MongoDB is needed. Segments are written to a temporary directory.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import random
+import statistics
+import tempfile
+import time
+
+from scripts.benchmarks import stub_environment
+from scripts.benchmarks.serialization import beatmap_page
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--keys", type=int, default=20)
+    parser.add_argument(
+        "--max-size", type=int, help="Segments, fewer than keys forces collisions."
+    )
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--ttl", type=float, default=1)
+    parser.add_argument("--query-seconds", type=float, default=0.05)
+    parser.add_argument("--limit", type=int, default=50)
+    return parser.parse_args()
+
+
+def worker(args, directory, results):
+    stub_environment()
+    from app.utils.shared_cache import ttl_cache
+
+    async def run():
+        cache = ttl_cache("bench", args.ttl, args.max_size or args.keys * 8, directory)
+        page = beatmap_page(args.limit)
+        queries = 0
+        hit_micros = []
+
+        async def query():
+            nonlocal queries
+            queries += 1
+            await asyncio.sleep(args.query_seconds)
+            return page
+
+        deadline = time.monotonic() + args.seconds
+        while time.monotonic() < deadline:
+            key = random.randrange(args.keys)
+            hits = cache.stats()["hits"]
+            started = time.perf_counter()
+            await cache.get_or_set(key, query)
+            if cache.stats()["hits"] > hits:
+                hit_micros.append((time.perf_counter() - started) * 1e6)
+            await asyncio.sleep(0.001)
+        results.put((queries, statistics.median(hit_micros or [0])))
+
+    asyncio.run(run())
+
+
+def main():
+    args = parse_args()
+    for name in ("per worker", "shared"):
+        with tempfile.TemporaryDirectory() as directory:
+            results = multiprocessing.Queue()
+            processes = [
+                multiprocessing.Process(
+                    target=worker,
+                    args=(args, directory if name == "shared" else None, results),
+                )
+                for _ in range(args.workers)
+            ]
+            for process in processes:
+                process.start()
+            outcomes = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+        queries = sum(queries for queries, _ in outcomes)
+        hit_micros = statistics.median(micros for _, micros in outcomes)
+        print(
+            f"{name:>10}: {queries:5} queries over {args.workers} workers, "
+            f"{hit_micros:6.1f}us median hit"
+        )
+
+
+if __name__ == "__main__":
+    main()
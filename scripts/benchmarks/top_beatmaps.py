@@ -0,0 +1,125 @@
+"""Compares the top-beatmaps aggregation with the old join-then-paginate shape.
+
+Seeds a scratch database on a local mongod, explains both pipelines over the
+raw ``Statistics`` and the rollups, then times them::
+
+    python -m scripts.benchmarks.top_beatmaps --mongodb-url mongodb://localhost:27017
+
+Exits non-zero if the current pipeline examines as many joined beatmaps as the
+old one, so it can run as a plan regression check. The ``--database``
+(``RonniaBenchmark`` by default) is dropped and reseeded unless ``--no-seed``
+is given, so never point it at a database holding real data.
+"""
+import argparse
+import asyncio
+import datetime
+import sys
+import time
+
+import bson
+
+from scripts.benchmarks import stub_environment
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongodb-url", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="RonniaBenchmark")
+    parser.add_argument("--beatmaps", type=int, default=5000)
+    parser.add_argument("--statistics", type=int, default=500000)
+    parser.add_argument("--no-seed", action="store_true")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=20)
+    return parser.parse_args()
+
+
+def lookup_docs_examined(explain: dict) -> int:
+    """Sums the documents the ``$lookup`` stages read from ``Beatmaps``."""
+    examined = 0
+    for stage in explain.get("stages", []):
+        if "$lookup" in stage:
+            examined += stage.get("totalDocsExamined", 0)
+    for shard in explain.get("shards", {}).values():
+        examined += lookup_docs_examined(shard)
+    return examined
+
+
+async def explain(collection, pipeline, options) -> dict:
+    command = {"aggregate": collection.name, "pipeline": pipeline, "cursor": {}}
+    command.update(options)
+    return await collection.database.command(
+        "explain", command, verbosity="executionStats"
+    )
+
+
+async def timed(collection, pipeline, options, rounds: int):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        rows = await collection.aggregate(pipeline, **options).to_list(length=None)
+    elapsed = (time.perf_counter() - started) / rounds * 1000
+    return elapsed, sum(len(bson.encode(row)) for row in rows)
+
+
+async def main():
+    args = parse_args()
+    stub_environment(MONGODB_URL=args.mongodb_url)
+    from app.db.mongodb import AsyncMongoClient
+    from app.db.top_beatmaps import TopBeatmapsQuery
+    from scripts.benchmarks.load_test import seed
+
+    mongo_db = AsyncMongoClient(args.mongodb_url, database_name=args.database)
+    if not args.no_seed:
+        args.users, args.live_ratio, args.excluded_per_user = 0, 0, 0
+        await seed(mongo_db, args)
+
+    time_start = datetime.datetime.utcnow() - datetime.timedelta(days=args.days)
+    rollup = mongo_db.beatmap_rollup
+    sources = {
+        "statistics": (
+            mongo_db.statistics_collection,
+            [
+                {"$match": {"timestamp": {"$gte": time_start}}},
+                {"$group": {"_id": "$requested_beatmap_id", "count": {"$sum": 1}}},
+            ],
+        ),
+        "rollups": (
+            rollup.rollup_collection,
+            [
+                {"$match": rollup._window_match(time_start)},
+                {"$group": {"_id": "$beatmapId", "count": {"$sum": "$count"}}},
+            ],
+        ),
+    }
+    queries = {
+        "join then paginate": TopBeatmapsQuery(
+            fields=None, allow_disk_use=True, paginate_before_join=False
+        ),
+        "paginate then join": mongo_db.top_beatmaps_query,
+    }
+
+    regressed = False
+    for source_name, (collection, source_stages) in sources.items():
+        print(f"{source_name}:")
+        examined = {}
+        for query_name, query in queries.items():
+            pipeline = query.pipeline(source_stages, args.limit, 0)
+            options = query.options(collection.name)
+            plan = await explain(collection, pipeline, options)
+            examined[query_name] = lookup_docs_examined(plan)
+            millis, size = await timed(collection, pipeline, options, args.rounds)
+            print(
+                f"{query_name:>22}: {examined[query_name]:7,} beatmaps examined, "
+                f"{millis:8.1f}ms per page, {size:,} bytes"
+            )
+        if examined["paginate then join"] >= examined["join then paginate"]:
+            regressed = True
+
+    mongo_db.close()
+    if regressed:
+        print("The current pipeline examines as many beatmaps as the old one.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""Counts MongoDB write commands for bursts of settings and exclusion edits.
+
+Simulates users toggling settings and excluding chatters one request at a
+time, with and without the write-behind queue, against a local mongod::
+
+    python -m scripts.benchmarks.write_behind --mongodb-url mongodb://localhost:27017 \\
+        --users 200 --edits 20
+
+The ``--database`` (``RonniaBenchmark`` by default) is dropped and reseeded on
+every run, so never point it at a database holding real data.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from pymongo import monitoring
+
+from scripts.benchmarks import stub_environment
+
+
+class WriteCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = 0
+
+    def started(self, event):
+        if event.command_name in ("update", "insert", "delete"):
+            self.commands += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongodb-url", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="RonniaBenchmark")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--edits", type=int, default=20, help="Edits per user.")
+    parser.add_argument("--window", type=float, default=0.5)
+    return parser.parse_args()
+
+
+async def burst(mongo_db, args):
+    from app.models.db import DBUserSettings
+
+    async def edit(osu_id: int):
+        for i in range(args.edits):
+            choice = random.random()
+            if choice < 0.6:
+                settings = DBUserSettings(echo=random.random() < 0.5)
+                await mongo_db.update_user_settings(osu_id, settings)
+            elif choice < 0.8:
+                await mongo_db.add_excluded_user(osu_id, f"chatter_{i}")
+            else:
+                await mongo_db.remove_excluded_user(osu_id, f"chatter_{i - 1}")
+            await asyncio.sleep(random.uniform(0, 0.05))
+
+    await asyncio.gather(*(edit(osu_id) for osu_id in range(1, args.users + 1)))
+
+
+async def run(args, write_behind_window):
+    from app.db.indexes import ensure_indexes
+    from app.db.mongodb import AsyncMongoClient
+
+    counter = WriteCounter()
+    mongo_db = AsyncMongoClient(
+        args.mongodb_url,
+        database_name=args.database,
+        write_behind_window=write_behind_window,
+        event_listeners=[counter],
+    )
+    await mongo_db.drop_database(args.database)
+    await ensure_indexes(mongo_db.users_db)
+    await mongo_db.users_collection.insert_many(
+        [
+            {"osuId": osu_id, "twitchId": osu_id, "excludedUsers": []}
+            for osu_id in range(1, args.users + 1)
+        ]
+    )
+    counter.commands = 0
+
+    if mongo_db.write_queue is not None:
+        mongo_db.write_queue.start()
+    started = time.perf_counter()
+    await burst(mongo_db, args)
+    if mongo_db.write_queue is not None:
+        await mongo_db.write_queue.stop()
+    elapsed = time.perf_counter() - started
+    mongo_db.close()
+    return counter.commands, elapsed
+
+
+async def main():
+    args = parse_args()
+    stub_environment(MONGODB_URL=args.mongodb_url)
+    edits = args.users * args.edits
+    for name, window in [("direct", None), ("write-behind", args.window)]:
+        commands, elapsed = await run(args, window)
+        print(
+            f"{name:>12}: {edits:,} edits, {commands:,} write commands "
+            f"({commands / edits:.2f} per edit), {elapsed:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,22 +1,41 @@
+"""Migrates users, settings and exclude lists from the legacy SQLite database.
+
+Users are streamed from SQLite in batches. Each batch is resolved against
+MongoDB with one ``$in`` query, avatars are fetched concurrently under a rate
+limit and all changes are written with a single ``bulk_write``. The last
+migrated ``user_id`` is checkpointed so an interrupted run resumes where it
+stopped::
+
+    DB_PATH=legacy.db MONGODB_URL=... python -m scripts.db_migration
+    python -m scripts.db_migration --stub-api   # offline, against scripts.stub_api
+"""
+import argparse
 import asyncio
+import json
 import logging
 import os
 import sqlite3
-from typing import List
+import time
+from typing import Dict, List, Optional
 
-import aiohttp
-from pymongo import UpdateOne
+from pydantic import BaseModel
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
 
 from app.db.mongodb import AsyncMongoClient
 from app.models.db import DBUser, DBSetting
+from app.utils.http import UpstreamHTTPClient
+from scripts.stub_api import start_stub_api
 
 logger = logging.getLogger(__name__)
 
+STUB_PORT = 8765
+
 
 def divide_chunks(l, n):
     # looping till length l
     for i in range(0, len(l), n):
-        yield l[i:i + n]
+        yield l[i : i + n]
 
 
 def dict_factory(cursor, row):
@@ -24,111 +43,250 @@ def dict_factory(cursor, row):
     return {key: value for key, value in zip(fields, row)}
 
 
-async def get_twitch_token():
-    client_id = os.getenv("TWITCH_CLIENT_ID")
-    client_secret = os.getenv("TWITCH_CLIENT_SECRET")
-    params = {"client_id": client_id,
-              "client_secret": client_secret,
-              "grant_type": "client_credentials"}
-
-    async with aiohttp.ClientSession() as sess:
-        async with sess.post("https://id.twitch.tv/oauth2/token", json=params) as resp:
-            result = await resp.json()
-
-    return result["access_token"]
-
-
-async def get_osu_token():
-    client_id = os.getenv("OSU_CLIENT_ID")
-    client_secret = os.getenv("OSU_CLIENT_SECRET")
-    params = {"client_id": client_id,
-              "client_secret": client_secret,
-              "grant_type": "client_credentials",
-              "scope": "public"}
-
-    async with aiohttp.ClientSession() as sess:
-        async with sess.post("https://osu.ppy.sh/oauth/token", json=params) as resp:
-            result = await resp.json()
-
-    return result["access_token"]
-
+def load_checkpoint(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return json.load(f)["last_user_id"]
+
+
+def save_checkpoint(path: str, last_user_id: int):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump({"last_user_id": last_user_id}, f)
+    os.replace(temporary_path, path)
+
+
+class RateLimiter:
+    """Spaces calls at least ``1 / rate`` seconds apart."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class MigrationReport(BaseModel):
+    read: int = 0
+    added: int = 0
+    already_migrated: int = 0
+    deleted_incomplete: int = 0
+    skipped_missing_avatar: int = 0
+
+
+class UpstreamAPI:
+    def __init__(
+        self,
+        http_client: UpstreamHTTPClient,
+        osu_base_url: str,
+        twitch_id_base_url: str,
+        twitch_api_base_url: str,
+        osu_rate: float,
+        concurrency: int,
+    ):
+        self.http_client = http_client
+        self.osu_base_url = osu_base_url
+        self.twitch_id_base_url = twitch_id_base_url
+        self.twitch_api_base_url = twitch_api_base_url
+        self.osu_limiter = RateLimiter(osu_rate)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self._osu_token: Optional[str] = None
+        self._twitch_token: Optional[str] = None
+        # Concurrent lookups of the first batch share one token request.
+        self._token_lock = asyncio.Lock()
+
+    async def _get_token(self, url: str, params: dict) -> str:
+        result = await self.http_client.request_json("POST", url, json=params)
+        return result["access_token"]
+
+    async def _osu_headers(self) -> dict:
+        if self._osu_token is None:
+            async with self._token_lock:
+                if self._osu_token is None:
+                    self._osu_token = await self._get_osu_token()
+        return {"Authorization": f"Bearer {self._osu_token}"}
+
+    async def _get_osu_token(self) -> str:
+        return await self._get_token(
+            f"{self.osu_base_url}/oauth/token",
+            {
+                "client_id": os.getenv("OSU_CLIENT_ID"),
+                "client_secret": os.getenv("OSU_CLIENT_SECRET"),
+                "grant_type": "client_credentials",
+                "scope": "public",
+            },
+        )
+
+    async def _twitch_headers(self) -> dict:
+        if self._twitch_token is None:
+            async with self._token_lock:
+                if self._twitch_token is None:
+                    self._twitch_token = await self._get_twitch_token()
+        return {
+            "Authorization": f"Bearer {self._twitch_token}",
+            "Client-Id": os.getenv("TWITCH_CLIENT_ID") or "",
+        }
+
+    async def _get_twitch_token(self) -> str:
+        return await self._get_token(
+            f"{self.twitch_id_base_url}/oauth2/token",
+            {
+                "client_id": os.getenv("TWITCH_CLIENT_ID"),
+                "client_secret": os.getenv("TWITCH_CLIENT_SECRET"),
+                "grant_type": "client_credentials",
+            },
+        )
+
+    async def get_twitch_avatar_urls(self, twitch_ids: List[str]) -> Dict[str, str]:
+        avatars = {}
+        headers = await self._twitch_headers()
+        for ids in divide_chunks(twitch_ids, 100):
+            params = [("id", twitch_id) for twitch_id in ids]
+            resp = await self.http_client.request_json(
+                "GET",
+                f"{self.twitch_api_base_url}/helix/users",
+                params=params,
+                headers=headers,
+            )
+            for res in resp["data"]:
+                avatars[res["id"]] = res["profile_image_url"]
+        return avatars
+
+    async def get_osu_avatar_url(self, osu_id: int) -> str:
+        headers = await self._osu_headers()
+        async with self.semaphore:
+            await self.osu_limiter.wait()
+            resp = await self.http_client.request_json(
+                "GET",
+                f"{self.osu_base_url}/api/v2/users/{osu_id}",
+                params={"key": "id"},
+                headers=headers,
+            )
+
+        if "error" in resp:
+            logger.info("Errored on osu! avatar of %s", osu_id)
+            return ""
+        return resp["avatar_url"]
+
+
+async def migrate_user_batch(
+    users: List[dict],
+    new_db: AsyncMongoClient,
+    api: UpstreamAPI,
+    report: MigrationReport,
+):
+    osu_ids = [int(user["osu_id"]) for user in users]
+    existing = {
+        user["osuId"]: user
+        for user in await new_db.users_collection.find(
+            {"osuId": {"$in": osu_ids}},
+            {"osuId": 1, "twitchId": 1, "osuAvatarUrl": 1, "twitchAvatarUrl": 1},
+        ).to_list(length=None)
+    }
 
-async def get_twitch_avatar_urls(twitch_ids: List[str]):
-    avatars = {}
-    token = await get_twitch_token()
-    header = {"Authorization": f"Bearer {token}",
-              "Client-Id": os.getenv("TWITCH_CLIENT_ID")}
-    for ids in divide_chunks(twitch_ids, 100):
-        params = {"id": ids}
-        async with aiohttp.ClientSession(headers=header) as sess:
-            async with sess.get("https://api.twitch.tv/helix/users", params=params) as r:
-                resp = await r.json()
-
-        for res in resp["data"]:
-            avatars[res["id"]] = res["profile_image_url"]
-
-    return avatars
-
-
-async def get_osu_avatar_url(osu_id: str):
-    token = await get_osu_token()
-    headers = {"Authorization": f"Bearer {token}"}
-    params = {"key": "id"}
-    async with aiohttp.ClientSession(headers=headers) as sess:
-        async with sess.get(f"https://osu.ppy.sh/api/v2/users/{osu_id}", params=params) as r:
-            resp = await r.json()
-
-    if "error" in resp:
-        logger.info(f"Errored on osu! avatar of {osu_id}")
-        return ""
-    logger.info(f"Got osu! avatar of {osu_id}")
-    await asyncio.sleep(1)
-    return resp["avatar_url"]
-
-
-def add_users(old_db, new_db):
-    users = old_db.execute("SELECT * FROM USERS;").fetchall()
-    twitch_ids = [user["twitch_id"] for user in users]
-    twitch_avatars = loop.run_until_complete(get_twitch_avatar_urls(twitch_ids))
+    operations = []
+    # The osu! id each operation writes, to report the ones that failed.
+    operation_ids = []
+    new_users = []
     for user in users:
-        user_id, osu_username, twitch_username, _, twitch_id, osu_id, _ = user.values()
-
-        if twitch_id not in twitch_avatars:
-            twitch_avatar = ""
-        else:
-            twitch_avatar = twitch_avatars[twitch_id]
-
-        osu_id = int(osu_id)
-        mongo_user: DBUser = loop.run_until_complete(new_db.get_user_from_osu_id(osu_id))
-        if mongo_user is not None:
-            logger.info(f"{mongo_user} already exists in database.")
-            if mongo_user.twitchAvatarUrl == "" or mongo_user.osuAvatarUrl == "":
-                logger.info(f"Found user {mongo_user} with no twitch avatar, deleting user...")
-                loop.run_until_complete(new_db.remove_user_by_twitch_id(mongo_user.twitchId))
-            continue
-
-        osu_avatar = loop.run_until_complete(get_osu_avatar_url(osu_id))
-
-        if osu_avatar == "" or twitch_avatar == "":
+        osu_id = int(user["osu_id"])
+        mongo_user = existing.get(osu_id)
+        if mongo_user is None:
+            new_users.append(user)
             continue
 
-        db_user = DBUser(osuId=osu_id,
-                         osuUsername=osu_username,
-                         osuAvatarUrl=osu_avatar,
-                         twitchId=twitch_id,
-                         twitchUsername=twitch_username,
-                         twitchAvatarUrl=twitch_avatar)
-        logger.info(f"Adding {osu_username}/{twitch_username} to database.")
-        loop.run_until_complete(
-            new_db.users_collection.update_one({"osuId": osu_id}, {"$set": db_user.dict()}, upsert=True))
-
-
-def add_user_settings(old_db, new_db):
+        report.already_migrated += 1
+        if not mongo_user.get("twitchAvatarUrl") or not mongo_user.get("osuAvatarUrl"):
+            logger.info("Found user %s with a missing avatar, deleting user...", osu_id)
+            operations.append(DeleteOne({"twitchId": mongo_user["twitchId"]}))
+            operation_ids.append(osu_id)
+            report.deleted_incomplete += 1
+
+    if new_users:
+        twitch_avatars = await api.get_twitch_avatar_urls(
+            [user["twitch_id"] for user in new_users]
+        )
+        osu_avatars = await asyncio.gather(
+            *(api.get_osu_avatar_url(int(user["osu_id"])) for user in new_users)
+        )
+        for user, osu_avatar in zip(new_users, osu_avatars):
+            twitch_avatar = twitch_avatars.get(str(user["twitch_id"]), "")
+            if osu_avatar == "" or twitch_avatar == "":
+                report.skipped_missing_avatar += 1
+                continue
+
+            db_user = DBUser(
+                osuId=int(user["osu_id"]),
+                osuUsername=user["osu_username"],
+                osuAvatarUrl=osu_avatar,
+                twitchId=user["twitch_id"],
+                twitchUsername=user["twitch_username"],
+                twitchAvatarUrl=twitch_avatar,
+            )
+            operations.append(
+                UpdateOne(
+                    {"osuId": db_user.osuId}, {"$set": db_user.dict()}, upsert=True
+                )
+            )
+            operation_ids.append(db_user.osuId)
+            report.added += 1
+
+    if operations:
+        try:
+            await new_db.users_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as bwe:
+            failed = [
+                operation_ids[error["index"]]
+                for error in bwe.details.get("writeErrors", [])
+            ]
+            logger.error("Failed to write users with osu! ids %s", failed)
+            # Stops before the checkpoint is saved, so a rerun retries the batch.
+            raise
+
+
+async def add_users(
+    old_db: sqlite3.Connection,
+    new_db: AsyncMongoClient,
+    api: UpstreamAPI,
+    batch_size: int,
+    checkpoint_path: str,
+) -> MigrationReport:
+    report = MigrationReport()
+    last_user_id = load_checkpoint(checkpoint_path)
+    if last_user_id:
+        logger.info("Resuming after user_id %s.", last_user_id)
+
+    cursor = old_db.execute(
+        "SELECT * FROM USERS WHERE user_id > ? ORDER BY user_id;", (last_user_id,)
+    )
+    while True:
+        users = cursor.fetchmany(batch_size)
+        if not users:
+            break
+        report.read += len(users)
+        await migrate_user_batch(users, new_db, api, report)
+        save_checkpoint(checkpoint_path, users[-1]["user_id"])
+        logger.info("Migrated users up to user_id %s: %s", users[-1]["user_id"], report)
+
+    return report
+
+
+async def add_user_settings(old_db, new_db):
     logger.info("Adding user settings to database...")
     user_settings = old_db.execute(
-        "SELECT * FROM user_settings INNER JOIN users ON users.user_id=user_settings.user_id;")
+        "SELECT * FROM user_settings INNER JOIN users ON users.user_id=user_settings.user_id;"
+    )
     user_range_settings = old_db.execute(
-        "SELECT * FROM user_range_settings INNER JOIN users ON users.user_id=user_range_settings.user_id;")
+        "SELECT * FROM user_range_settings INNER JOIN users ON users.user_id=user_range_settings.user_id;"
+    )
 
     operations = []
     db_settings = {}
@@ -153,68 +311,159 @@ def add_user_settings(old_db, new_db):
         else:
             db_settings[user_id] = {setting_key: value}
 
-    logger.info(f"Found {len(db_settings)} users with settings.")
+    logger.info("Found %d users with settings.", len(db_settings))
     for user_id, settings in db_settings.items():
-        operations.append(UpdateOne({"osuId": int(user_id)}, {"$set": {"settings": settings}}))
+        operations.append(
+            UpdateOne({"osuId": int(user_id)}, {"$set": {"settings": settings}})
+        )
 
-    result = loop.run_until_complete(new_db.bulk_write_operations(operations))
-    logger.info(f"Added {result.modified_count} settings to database.")
+    if operations:
+        result = await new_db.bulk_write_operations(operations)
+        logger.info("Added %d settings to database.", result.modified_count)
 
 
-def add_settings(old_db, new_db):
+async def add_settings(old_db, new_db):
     logger.info("Adding default settings to database...")
     settings = old_db.execute("SELECT * FROM settings;")
     range_settings = old_db.execute("SELECT * FROM range_settings;")
     operations = []
     for setting in settings:
         _id, name, value, description = setting.values()
-        db_setting = DBSetting(name=name, value=value, description=description, type="value")
-        UpdateOne({"name": db_setting.name}, {"$set": db_setting.dict()}, upsert=True)
-        operations.append(UpdateOne({"name": db_setting.name}, {"$set": db_setting.dict()}, upsert=True))
+        db_setting = DBSetting(
+            name=name, value=value, description=description, type="value"
+        )
+        operations.append(
+            UpdateOne(
+                {"name": db_setting.name}, {"$set": db_setting.dict()}, upsert=True
+            )
+        )
 
     for setting in range_settings:
         _id, name, low_value, high_value, description = setting.values()
-        db_setting = DBSetting(name=name, value=(low_value, high_value), description=description, type="range")
-        UpdateOne({"name": db_setting.name}, {"$set": db_setting.dict()}, upsert=True)
-        operations.append(UpdateOne({"name": db_setting.name}, {"$set": db_setting.dict()}, upsert=True))
+        db_setting = DBSetting(
+            name=name,
+            value=(low_value, high_value),
+            description=description,
+            type="range",
+        )
+        operations.append(
+            UpdateOne(
+                {"name": db_setting.name}, {"$set": db_setting.dict()}, upsert=True
+            )
+        )
 
-    result = loop.run_until_complete(new_db.bulk_write_operations(operations, collection="Settings"))
-    logger.info(f"Added {result.modified_count} settings to database.")
+    result = await new_db.bulk_write_operations(operations, collection="Settings")
+    logger.info("Added %d settings to database.", result.modified_count)
 
 
-def add_exclude_list(old_db, new_db):
+async def add_exclude_list(old_db, new_db):
     logger.info("Adding exclude list to database...")
-    exclude_list = old_db.execute("SELECT * FROM exclude_list INNER JOIN users u on exclude_list.user_id = u.user_id;")
+    exclude_list = old_db.execute(
+        "SELECT * FROM exclude_list INNER JOIN users u on exclude_list.user_id = u.user_id;"
+    )
     operations = []
     for user in exclude_list:
-        user_id, excluded_users, osu_username, twitch_username, _, twitch_id, osu_id, _ = user.values()
+        (
+            user_id,
+            excluded_users,
+            osu_username,
+            twitch_username,
+            _,
+            twitch_id,
+            osu_id,
+            _,
+        ) = user.values()
 
         if excluded_users == "":
             continue
         excluded_users_list = excluded_users.split(",")
-        logger.info(f"Adding {osu_username}/{twitch_username} to exclude list.")
+        logger.info("Adding %s/%s to exclude list.", osu_username, twitch_username)
         operations.append(
-            UpdateOne({"osuId": int(osu_id)}, {"$set": {"excludedUsers": excluded_users_list}}, upsert=True))
+            UpdateOne(
+                {"osuId": int(osu_id)},
+                {"$set": {"excludedUsers": excluded_users_list}},
+                upsert=True,
+            )
+        )
 
     if len(operations) != 0:
-        result = loop.run_until_complete(new_db.bulk_write_operations(operations))
-        logger.info(f"Added {result.modified_count} users to exclude list.")
-
-
-if __name__ == '__main__':
+        result = await new_db.bulk_write_operations(operations)
+        logger.info("Added %d users to exclude list.", result.modified_count)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Migrates the legacy SQLite database to MongoDB."
+    )
+    parser.add_argument("--db-path", default=os.getenv("DB_PATH"))
+    parser.add_argument("--mongodb-url", default=os.getenv("MONGODB_URL"))
+    parser.add_argument("--database", default=os.getenv("MONGODB_DATABASE", "Ronnia"))
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--osu-rate", type=float, default=5.0, help="osu! API requests per second."
+    )
+    parser.add_argument("--checkpoint", default=".db_migration.checkpoint")
+    parser.add_argument(
+        "--stub-api",
+        action="store_true",
+        help="Fetch avatars from a local stub API instead of osu! and Twitch.",
+    )
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    old_db = sqlite3.connect(args.db_path)
+    old_db.row_factory = dict_factory
+    new_db = AsyncMongoClient(args.mongodb_url, database_name=args.database)
+    http_client = UpstreamHTTPClient()
+    await http_client.start()
+
+    stub_runner = None
+    osu_base_url = os.getenv("OSU_BASE_URL", "https://osu.ppy.sh")
+    twitch_id_base_url = os.getenv("TWITCH_ID_BASE_URL", "https://id.twitch.tv")
+    twitch_api_base_url = os.getenv("TWITCH_API_BASE_URL", "https://api.twitch.tv")
+    if args.stub_api:
+        stub_runner = await start_stub_api(STUB_PORT)
+        osu_base_url = (
+            twitch_id_base_url
+        ) = twitch_api_base_url = f"http://127.0.0.1:{STUB_PORT}"
+
+    api = UpstreamAPI(
+        http_client,
+        osu_base_url,
+        twitch_id_base_url,
+        twitch_api_base_url,
+        osu_rate=args.osu_rate,
+        concurrency=args.concurrency,
+    )
+    started = time.monotonic()
+    try:
+        report = await add_users(old_db, new_db, api, args.batch_size, args.checkpoint)
+        # await add_settings(old_db, new_db)
+        await add_user_settings(old_db, new_db)
+        await add_exclude_list(old_db, new_db)
+    finally:
+        await http_client.close()
+        if stub_runner is not None:
+            await stub_runner.cleanup()
+        new_db.close()
+        old_db.close()
+
+    logger.info("Migration finished in %.1fs: %s", time.monotonic() - started, report)
+    for host, stats in http_client.stats().items():
+        logger.info("%s: %s", host, stats)
+
+
+if __name__ == "__main__":
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    formatter = logging.Formatter(
+        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
     ch = logging.StreamHandler()
     ch.setFormatter(formatter)
     logger.addHandler(ch)
 
-    old_db = sqlite3.connect(os.getenv("DB_PATH"))
-    old_db.row_factory = dict_factory
-    new_db = AsyncMongoClient(os.getenv("MONGODB_URL"))
-
-    loop = asyncio.get_event_loop()
-    add_users(old_db, new_db)
-    # add_settings(old_db, new_db)
-    add_user_settings(old_db, new_db)
-    add_exclude_list(old_db, new_db)
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+"""Creates a small legacy SQLite database for trying out ``scripts.db_migration``.
+
+    python -m scripts.legacy_fixture legacy.db --users 500
+"""
+import argparse
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE users (
+    user_id INTEGER PRIMARY KEY,
+    osu_username TEXT,
+    twitch_username TEXT,
+    enabled INTEGER,
+    twitch_id TEXT,
+    osu_id TEXT,
+    created_at TEXT
+);
+CREATE TABLE user_settings (user_id INTEGER, key TEXT, value REAL);
+CREATE TABLE user_range_settings (
+    user_id INTEGER, key TEXT, range_start REAL, range_end REAL
+);
+CREATE TABLE settings (id INTEGER PRIMARY KEY, name TEXT, value REAL, description TEXT);
+CREATE TABLE range_settings (
+    id INTEGER PRIMARY KEY, name TEXT, low_value REAL, high_value REAL, description TEXT
+);
+CREATE TABLE exclude_list (user_id INTEGER, excluded_user TEXT);
+"""
+
+
+def create_fixture(path: str, user_count: int):
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    for user_id in range(1, user_count + 1):
+        db.execute(
+            "INSERT INTO users VALUES (?, ?, ?, 1, ?, ?, '2022-01-01')",
+            (
+                user_id,
+                f"osu_user_{user_id}",
+                f"twitch_user_{user_id}",
+                str(100000 + user_id),
+                str(200000 + user_id),
+            ),
+        )
+        db.execute("INSERT INTO user_settings VALUES (?, 'cp-only', 1)", (user_id,))
+        db.execute(
+            "INSERT INTO user_range_settings VALUES (?, 'sr', -1, 7.5)", (user_id,)
+        )
+        db.execute(
+            "INSERT INTO exclude_list VALUES (?, ?)",
+            (user_id, "nightbot,streamelements"),
+        )
+    db.commit()
+    db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+    create_fixture(args.path, args.users)
@@ -0,0 +1,50 @@
+import argparse
+import asyncio
+import logging
+import sys
+
+from app.config import settings
+from app.db.indexes import ensure_indexes, find_index_drift, verify_query_plans
+from app.db.mongodb import AsyncMongoClient
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Manages the declared MongoDB indexes."
+    )
+    parser.add_argument(
+        "command",
+        choices=["ensure", "check", "verify"],
+        help="ensure: create missing indexes, check: report drift, "
+        "verify: fail if any query method does a collection scan.",
+    )
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    mongo_db = AsyncMongoClient.from_settings(settings)
+
+    if args.command == "ensure":
+        failed = await ensure_indexes(mongo_db.users_db)
+        for name in failed:
+            print(f"{name} could not be created")
+        if failed:
+            sys.exit(1)
+    elif args.command == "check":
+        drift = await find_index_drift(mongo_db.users_db)
+        for line in drift:
+            print(line)
+        if drift:
+            sys.exit(1)
+    elif args.command == "verify":
+        offenders = await verify_query_plans(settings)
+        for line in offenders:
+            print(line)
+        if offenders:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
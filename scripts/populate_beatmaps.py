@@ -1,57 +1,211 @@
+"""Fetches every requested beatmap that is missing from the ``Beatmaps`` collection.
+
+Requested ids are streamed from ``Statistics`` in ascending order and handled
+chunk by chunk: one ``$in`` query finds the ids already stored, the rest are
+fetched from the osu! multi-beatmap endpoint in concurrent batches and
+upserted with a single ``bulk_write``. The last finished id is checkpointed so
+an interrupted run resumes where it stopped::
+
+    python -m scripts.populate_beatmaps
+    python -m scripts.populate_beatmaps --dry-run
+"""
+import argparse
 import asyncio
-import datetime
+import json
+import os
+import time
+from typing import List, Optional
 
-import aiohttp
+from pymongo import UpdateOne
 
 from app.config import settings
 from app.db.mongodb import AsyncMongoClient
+from app.utils.http import UpstreamHTTPClient
+from scripts.stub_api import start_stub_api
+
+# The osu! API returns at most 50 beatmaps per lookup.
+LOOKUP_BATCH_SIZE = 50
+STUB_PORT = 8765
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Adds missing requested beatmaps to the database."
+    )
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--checkpoint", default=".populate_beatmaps.checkpoint")
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore the saved checkpoint."
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Fetch from a local stub API and write nothing.",
+    )
+    return parser.parse_args()
+
 
+def load_checkpoint(path: str) -> Optional[int]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)["last_id"]
 
-async def get_access_token():
-    url = "https://osu.ppy.sh/oauth/token"
-    params = {
-        "client_id": settings.OSU_CLIENT_ID,
-        "client_secret": settings.OSU_CLIENT_SECRET,
-        "grant_type": "client_credentials",
-        "scope": "public",
-    }
-    async with aiohttp.ClientSession() as sess:
-        async with sess.post(url, json=params) as resp:
-            token_response = await resp.json()
 
+def save_checkpoint(path: str, last_id: int):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump({"last_id": last_id}, f)
+    os.replace(temporary_path, path)
+
+
+async def get_access_token(http_client: UpstreamHTTPClient, base_url: str):
+    token_response = await http_client.request_json(
+        "POST",
+        f"{base_url}/oauth/token",
+        json={
+            "client_id": settings.OSU_CLIENT_ID,
+            "client_secret": settings.OSU_CLIENT_SECRET,
+            "grant_type": "client_credentials",
+            "scope": "public",
+        },
+    )
     return token_response["access_token"]
 
 
-async def main():
-    mongo_db = AsyncMongoClient(settings.MONGODB_URL)
-    access_token = await get_access_token()
-    headers = {"Authorization": f"Bearer {access_token}"}
-    requested_beatmaps = await mongo_db.get_top_requested_beatmaps(
-        limit=100000, offset=0, time_start=datetime.datetime(2000, 1, 1)
+async def iter_requested_chunks(
+    mongo_db: AsyncMongoClient, after: Optional[int], chunk_size: int
+):
+    aggregation = [{"$group": {"_id": "$requested_beatmap_id"}}]
+    if after is not None:
+        aggregation.append({"$match": {"_id": {"$gt": after}}})
+    aggregation.append({"$sort": {"_id": 1}})
+
+    chunk = []
+    cursor = mongo_db.statistics_collection.aggregate(
+        aggregation, allowDiskUse=True, batchSize=chunk_size
     )
-    print(f"Found {len(requested_beatmaps)} beatmaps.")
-    for beatmap_details in requested_beatmaps:
-        beatmap_id = beatmap_details["_id"]
-
-        db_beatmap = await mongo_db.beatmaps_collection.find_one({"id": beatmap_id})
-        if db_beatmap is not None:
-            print(f"Beatmap {beatmap_id} already exists.")
-            continue
-
-        beatmap_url = f"https://osu.ppy.sh/api/v2/beatmaps/{beatmap_id}"
-        print(f"Fetching beatmap {beatmap_id}...")
-        async with aiohttp.ClientSession(headers=headers) as sess:
-            async with sess.get(beatmap_url) as resp:
-                beatmap_resp = await resp.json()
-
-        if "error" in beatmap_resp:
-            print(f"Beatmap {beatmap_id} not found.")
-            continue
-
-        await mongo_db.beatmaps_collection.update_one(
-            {"id": beatmap_id}, {"$set": beatmap_resp}, upsert=True
+    async for row in cursor:
+        chunk.append(row["_id"])
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BeatmapFetcher:
+    def __init__(
+        self,
+        http_client: UpstreamHTTPClient,
+        base_url: str,
+        access_token: str,
+        concurrency: int,
+    ):
+        self.http_client = http_client
+        self.url = f"{base_url}/api/v2/beatmaps"
+        self.headers = {"Authorization": f"Bearer {access_token}"}
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def _fetch_batch(self, beatmap_ids: List[int]) -> List[dict]:
+        params = [("ids[]", beatmap_id) for beatmap_id in beatmap_ids]
+        async with self.semaphore:
+            response = await self.http_client.request_json(
+                "GET", self.url, params=params, headers=self.headers
+            )
+        return response.get("beatmaps", [])
+
+    async def fetch(self, beatmap_ids: List[int]) -> List[dict]:
+        batches = [
+            beatmap_ids[i : i + LOOKUP_BATCH_SIZE]
+            for i in range(0, len(beatmap_ids), LOOKUP_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(*(self._fetch_batch(b) for b in batches))
+        return [beatmap for batch in results for beatmap in batch]
+
+
+async def populate(
+    mongo_db: AsyncMongoClient, fetcher: BeatmapFetcher, args: argparse.Namespace
+):
+    after = None if args.restart else load_checkpoint(args.checkpoint)
+    if after is not None:
+        print(f"Resuming after beatmap {after}.")
+
+    seen = existing = fetched = not_found = 0
+    started = time.monotonic()
+    pending_write: Optional[asyncio.Task] = None
+    pending_last_id = None
+
+    async def finish_pending_write():
+        await pending_write
+        if not args.dry_run:
+            save_checkpoint(args.checkpoint, pending_last_id)
+
+    async for chunk in iter_requested_chunks(mongo_db, after, args.chunk_size):
+        stored = await mongo_db.beatmaps_collection.distinct(
+            "id", {"id": {"$in": chunk}}
+        )
+        stored = set(stored)
+        missing = [beatmap_id for beatmap_id in chunk if beatmap_id not in stored]
+        beatmaps = await fetcher.fetch(missing) if missing else []
+
+        # Writing this chunk overlaps with reading and fetching the next one.
+        if pending_write is not None:
+            await finish_pending_write()
+        pending_write = asyncio.create_task(write_chunk(mongo_db, beatmaps, args))
+        pending_last_id = chunk[-1]
+
+        seen += len(chunk)
+        existing += len(stored)
+        fetched += len(beatmaps)
+        not_found += len(missing) - len(beatmaps)
+        rate = seen / max(time.monotonic() - started, 1e-9)
+        print(
+            f"Processed {seen} ids up to {chunk[-1]} ({rate:.0f}/s): "
+            f"{existing} existing, {fetched} fetched, {not_found} not found."
         )
-        print(f"Beatmap {beatmap_id} added to database.")
+
+    if pending_write is not None:
+        await finish_pending_write()
+    print(f"Done. {fetched} beatmaps added, {not_found} not found upstream.")
+
+
+async def write_chunk(
+    mongo_db: AsyncMongoClient, beatmaps: List[dict], args: argparse.Namespace
+):
+    if not beatmaps or args.dry_run:
+        return
+    operations = [
+        UpdateOne({"id": beatmap["id"]}, {"$set": beatmap}, upsert=True)
+        for beatmap in beatmaps
+    ]
+    await mongo_db.beatmaps_collection.bulk_write(operations, ordered=False)
+
+
+async def main():
+    args = parse_args()
+    mongo_db = AsyncMongoClient.from_settings(settings)
+    http_client = UpstreamHTTPClient.from_settings(settings)
+    await http_client.start()
+
+    stub_runner = None
+    base_url = settings.OSU_BASE_URL
+    if args.dry_run:
+        stub_runner = await start_stub_api(STUB_PORT)
+        base_url = f"http://127.0.0.1:{STUB_PORT}"
+        print(f"Dry run against the stub API at {base_url}, nothing is written.")
+
+    try:
+        access_token = await get_access_token(http_client, base_url)
+        fetcher = BeatmapFetcher(http_client, base_url, access_token, args.concurrency)
+        await populate(mongo_db, fetcher, args)
+        for host, stats in http_client.stats().items():
+            print(f"{host}: {stats}")
+    finally:
+        await http_client.close()
+        if stub_runner is not None:
+            await stub_runner.cleanup()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import datetime
+import logging
+import sys
+
+from app.config import settings
+from app.db.indexes import ensure_indexes
+from app.db.mongodb import AsyncMongoClient
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Maintains the pre-aggregated beatmap request rollups."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill = subparsers.add_parser("backfill", help="Rebuild rollups from history.")
+    backfill.add_argument(
+        "--since",
+        type=datetime.datetime.fromisoformat,
+        default=None,
+        help="Only rebuild buckets from this timestamp on (default: all history).",
+    )
+
+    subparsers.add_parser("sync", help="Fold new statistics into the rollups once.")
+
+    check = subparsers.add_parser(
+        "check", help="Compare rollups with the raw statistics aggregation."
+    )
+    check.add_argument(
+        "--days", type=int, default=30, help="Size of the window to compare."
+    )
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    mongo_db = AsyncMongoClient.from_settings(settings)
+    rollup = mongo_db.beatmap_rollup
+    await ensure_indexes(mongo_db.users_db)
+
+    if args.command == "backfill":
+        await rollup.backfill(since=args.since)
+    elif args.command == "sync":
+        await rollup.sync()
+    elif args.command == "check":
+        time_start = datetime.datetime.utcnow() - datetime.timedelta(days=args.days)
+        mismatches = await rollup.check_consistency(time_start)
+        for beatmap_id, counts in mismatches.items():
+            print(
+                f"Beatmap {beatmap_id}: raw={counts['raw']} rollup={counts['rollup']}"
+            )
+        if mismatches:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""Local stand-in for the osu! and Twitch APIs.
+
+Serves just enough of both APIs for the login flow, the migration and the
+beatmap scripts to run offline. Point ``OSU_BASE_URL``, ``TWITCH_ID_BASE_URL``
+and ``TWITCH_API_BASE_URL`` at it::
+
+    python -m scripts.stub_api --port 8765
+"""
+import argparse
+import asyncio
+import random
+
+from aiohttp import web
+
+
+def fake_beatmap(beatmap_id: int) -> dict:
+    return {
+        "id": beatmap_id,
+        "beatmapset_id": beatmap_id // 3,
+        "mode": "osu",
+        "version": f"Difficulty {beatmap_id}",
+        "difficulty_rating": round(random.uniform(1, 9), 2),
+        "total_length": random.randint(60, 400),
+        "url": f"https://osu.ppy.sh/beatmaps/{beatmap_id}",
+        "beatmapset": {
+            "id": beatmap_id // 3,
+            "artist": "Stub Artist",
+            "title": f"Stub Song {beatmap_id}",
+            "creator": "stub",
+            "covers": {
+                "cover": f"https://assets.ppy.sh/beatmaps/{beatmap_id // 3}/covers/cover.jpg",
+                "list": f"https://assets.ppy.sh/beatmaps/{beatmap_id // 3}/covers/list.jpg",
+            },
+        },
+        "failtimes": {
+            "fail": [random.randint(0, 100) for _ in range(100)],
+            "exit": [random.randint(0, 100) for _ in range(100)],
+        },
+    }
+
+
+def fake_osu_user(user_id: int) -> dict:
+    return {
+        "id": user_id,
+        "username": f"osu_user_{user_id}",
+        "avatar_url": f"https://a.ppy.sh/{user_id}",
+    }
+
+
+def fake_twitch_user(user_id: int) -> dict:
+    return {
+        "id": str(user_id),
+        "login": f"twitch_user_{user_id}",
+        "profile_image_url": f"https://static-cdn.jtvnw.net/{user_id}.png",
+    }
+
+
+def create_app(latency: float = 0.0) -> web.Application:
+    async def delay():
+        if latency:
+            await asyncio.sleep(latency)
+
+    async def token(request: web.Request):
+        await delay()
+        return web.json_response(
+            {
+                "access_token": "stub-access-token",
+                "token_type": "Bearer",
+                "expires_in": 86400,
+                "refresh_token": "stub-refresh-token",
+            }
+        )
+
+    async def osu_me(request: web.Request):
+        await delay()
+        return web.json_response(fake_osu_user(1))
+
+    async def osu_user(request: web.Request):
+        await delay()
+        return web.json_response(fake_osu_user(int(request.match_info["user_id"])))
+
+    async def osu_beatmap(request: web.Request):
+        await delay()
+        return web.json_response(fake_beatmap(int(request.match_info["beatmap_id"])))
+
+    async def osu_beatmaps(request: web.Request):
+        await delay()
+        ids = [int(beatmap_id) for beatmap_id in request.query.getall("ids[]", [])]
+        return web.json_response({"beatmaps": [fake_beatmap(i) for i in ids]})
+
+    async def twitch_users(request: web.Request):
+        await delay()
+        ids = [int(user_id) for user_id in request.query.getall("id", ["1"])]
+        return web.json_response({"data": [fake_twitch_user(i) for i in ids]})
+
+    app = web.Application()
+    app.add_routes(
+        [
+            web.post("/oauth/token", token),
+            web.get("/api/v2/me", osu_me),
+            web.get("/api/v2/users/{user_id}", osu_user),
+            web.get("/api/v2/beatmaps/{beatmap_id}", osu_beatmap),
+            web.get("/api/v2/beatmaps", osu_beatmaps),
+            web.post("/oauth2/token", token),
+            web.get("/helix/users", twitch_users),
+        ]
+    )
+    return app
+
+
+async def start_stub_api(port: int, latency: float = 0.0) -> web.AppRunner:
+    runner = web.AppRunner(create_app(latency))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds to delay each response."
+    )
+    args = parser.parse_args()
+    web.run_app(create_app(args.latency), host="127.0.0.1", port=args.port)
@@ -0,0 +1,105 @@
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.utils.compression import CompressionMiddleware
+from app.utils.etag import (
+    PRIVATE_CACHE_CONTROL,
+    bytes_etag,
+    etag_matches,
+    not_modified,
+    set_validators,
+)
+
+LARGE_BODY = b'{"beatmaps":[' + b",".join([b'{"id":1}'] * 200) + b"]}"
+SMALL_BODY = b'{"id":1}'
+
+
+def versioned(body: bytes):
+    async def endpoint(request: Request):
+        etag = bytes_etag(body)
+        if etag_matches(request, etag):
+            return not_modified(etag, PRIVATE_CACHE_CONTROL)
+        response = Response(body, media_type="application/json")
+        set_validators(response, etag, PRIVATE_CACHE_CONTROL)
+        return response
+
+    return endpoint
+
+
+async def stream():
+    async def events():
+        yield b"data: {}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+app = FastAPI()
+app.add_api_route("/large", versioned(LARGE_BODY))
+app.add_api_route("/small", versioned(SMALL_BODY))
+app.add_api_route("/stream", stream)
+app.add_middleware(CompressionMiddleware, minimum_size=100)
+client = TestClient(app)
+
+
+def test_identity_response_keeps_strong_etag():
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == bytes_etag(LARGE_BODY)
+    assert "content-encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+
+def test_compressed_response_has_weak_etag():
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"] == f"W/{bytes_etag(LARGE_BODY)}"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.content == LARGE_BODY
+
+
+def test_not_modified_repeats_validators_of_compressed_response():
+    first = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    response = client.get(
+        "/large",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["ETag"]},
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == first.headers["ETag"]
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert "content-encoding" not in response.headers
+
+
+def test_weak_etag_revalidates_identity_request():
+    etag = f"W/{bytes_etag(LARGE_BODY)}"
+    response = client.get(
+        "/large", headers={"Accept-Encoding": "identity", "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == bytes_etag(LARGE_BODY)
+
+
+def test_stale_etag_gets_full_response():
+    response = client.get(
+        "/large", headers={"Accept-Encoding": "gzip", "If-None-Match": '"stale"'}
+    )
+    assert response.status_code == 200
+    assert response.content == LARGE_BODY
+
+
+def test_small_body_is_not_compressed_but_varies():
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.headers["ETag"] == f"W/{bytes_etag(SMALL_BODY)}"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.content == SMALL_BODY
+
+
+def test_event_stream_passes_through():
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
+    assert response.content == b"data: {}\n\n"
@@ -0,0 +1,33 @@
+import base64
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    values = {"count": 12, "id": 345678}
+    cursor = encode_cursor(values)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == values
+
+
+@pytest.mark.parametrize("cursor", [None, ""])
+def test_missing_cursor(cursor):
+    assert decode_cursor(cursor) is None
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not a cursor!",
+        base64.urlsafe_b64encode(b"{not json").decode(),
+        base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+        encode_cursor([1, 2]),
+    ],
+)
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as raised:
+        decode_cursor(cursor)
+    assert raised.value.status_code == 400
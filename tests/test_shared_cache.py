@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+from app.utils.shared_cache import SharedTTLCache
+
+
+class Factory:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def worker(tmp_path, **kwargs) -> SharedTTLCache:
+    """A cache with its own segment handles, like another worker would have."""
+    return SharedTTLCache("test", str(tmp_path), ttl=60, **kwargs)
+
+
+def test_entry_is_shared_between_workers(tmp_path):
+    async def run():
+        load = Factory("value")
+        assert await worker(tmp_path).get_or_set("key", load) == "value"
+        assert await worker(tmp_path).get_or_set("key", load) == "value"
+        return load.calls
+
+    assert asyncio.run(run()) == 1
+
+
+def test_keys_sharing_a_segment_do_not_evict_each_other(tmp_path):
+    async def run():
+        first, second = worker(tmp_path, max_size=1), worker(tmp_path, max_size=1)
+        load_a, load_b = Factory("a"), Factory("b")
+        assert await first.get_or_set("a", load_a) == "a"
+        assert await first.get_or_set("b", load_b) == "b"
+        assert await first.get_or_set("a", load_a) == "a"
+        assert await first.get_or_set("b", load_b) == "b"
+        # The segment still holds "a" for every worker, "b" is cached per worker.
+        assert await second.get_or_set("a", load_a) == "a"
+        assert await second.get_or_set("b", load_b) == "b"
+        return load_a.calls, load_b.calls, first.stats()["local"]
+
+    assert asyncio.run(run()) == (1, 2, 1)
+
+
+def test_entry_too_large_for_a_segment(tmp_path):
+    async def run():
+        first = worker(tmp_path, slot_size=256, wait_timeout=5)
+        second = worker(tmp_path, slot_size=256, wait_timeout=5)
+        load = Factory(b"x" * 1000)
+        assert await first.get_or_set("key", load) == load.value
+        assert await first.get_or_set("key", load) == load.value
+        started = time.monotonic()
+        # Told by the marker to load it itself instead of waiting it out.
+        assert await second.get_or_set("key", load) == load.value
+        return load.calls, time.monotonic() - started
+
+    calls, waited = asyncio.run(run())
+    assert calls == 2
+    assert waited < 1
+
+
+def test_waiters_retry_when_the_loading_call_is_cancelled(tmp_path):
+    async def run():
+        cache = worker(tmp_path)
+        calls = 0
+
+        async def slow():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return calls
+
+        leader = asyncio.create_task(cache.get_or_set("key", slow))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(cache.get_or_set("key", slow)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*waiters), calls, leader.cancelled()
+
+    values, calls, cancelled = asyncio.run(run())
+    assert values == [2, 2, 2]
+    assert calls == 2
+    assert cancelled